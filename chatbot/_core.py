@@ -0,0 +1,735 @@
+"""
+Session storage, the session manifest/search index and Claude Code plumbing
+shared by the web app (app.py) and the CLI (chatbot_cli.py), so both read,
+write, lock and index session files the same way and parse Claude Code's
+streaming output with one implementation.
+"""
+
+import bisect
+import hashlib
+import itertools
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import orjson
+
+try:
+    import fcntl
+except ImportError:  # Windows: session writes are not locked across processes
+    fcntl = None
+
+# Configuration
+SESSIONS_DIR = Path(__file__).parent / "sessions"
+SESSIONS_DIR.mkdir(exist_ok=True)
+SHARES_FILE = SESSIONS_DIR / "shares.json"  # Legacy share registry (web app), not a session
+SEARCH_INDEX_FILE = SESSIONS_DIR / "search.db"
+DEFAULT_MODEL = "sonnet"
+CLAUDE_BIN = shutil.which("claude") or "claude"  # Resolved on PATH once, not on every call
+SYSTEM_PROMPT = "You are a helpful AI assistant. Respond to the user's message naturally and conversationally."
+SESSION_COMPACT_INTERVAL = 32  # Fold a session's append-only log into its JSON file every N messages
+
+
+def generate_title_from_message(message: str, max_length: int = 50) -> str:
+    """Generate a conversation title from the first message."""
+    if not message:
+        return "New Conversation"
+    # Strip once up front; short messages are returned without slicing
+    message = message.strip()
+    if len(message) <= max_length:
+        return message
+    # Truncate and add ellipsis if too long
+    return message[:max_length].rstrip() + "..."
+
+
+@contextmanager
+def session_write_lock(session_id: str):
+    """
+    Hold an exclusive advisory lock on a session while writing its files, so
+    concurrent requests and the CLI write one at a time. Not reentrant: flock
+    treats each open() as a separate holder.
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = _lock_path(session_id)
+    while True:
+        lock_file = open(lock_path, 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # delete_session_files removes the lock file while holding it; a
+        # writer that was waiting on it then locks the file at the path now
+        try:
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _lock_path(session_id: str) -> Path:
+    """The file session_write_lock locks for a session."""
+    return SESSIONS_DIR / f".{session_id}.lock"
+
+
+def delete_session_files(session_id: str) -> bool:
+    """
+    Delete a session's snapshot, append-only log and lock file, under its
+    write lock so a save in progress finishes first. Returns False if the
+    session has no snapshot.
+    """
+    session_file = SESSIONS_DIR / f"{session_id}.json"
+    with session_write_lock(session_id):
+        try:
+            try:
+                session_file.unlink()
+            except FileNotFoundError:
+                return False
+            session_file.with_suffix(".ndjson").unlink(missing_ok=True)
+            return True
+        finally:
+            _lock_path(session_id).unlink(missing_ok=True)
+
+
+def read_session_file(session_file: Path) -> Dict:
+    """
+    Load a session: the JSON snapshot plus any records in its append-only log
+    ({session_id}.ndjson). Each log record holds messages appended at index
+    "at" and top-level fields to set; replaying is idempotent, so a log left
+    behind by an interrupted compaction adds nothing twice.
+    """
+    data = orjson.loads(session_file.read_bytes())
+    try:
+        with open(session_file.with_suffix(".ndjson"), 'rb') as f:
+            for line in f:
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    break  # Torn final write
+                data.update(record.get("fields", {}))
+                messages = data.setdefault("messages", [])
+                for index, msg in enumerate(record.get("messages", []), start=record.get("at", 0)):
+                    if index == len(messages):
+                        messages.append(msg)
+    except FileNotFoundError:
+        pass
+    return data
+
+
+def session_digest(conversation: Dict) -> bytes:
+    """
+    Content hash of a session, ignoring updated_at (which every save bumps), so
+    a save that would write back what was loaded or last saved can be skipped.
+    """
+    return hashlib.blake2b(orjson.dumps({**conversation, "updated_at": None}), digest_size=16).digest()
+
+
+def write_session_file(session_id: str, session_file: Path, conversation: Dict) -> None:
+    """
+    Save a full session snapshot, replacing (and removing) its append-only log.
+    A sibling temp file is renamed over the session, so readers never see a
+    half-written file.
+    """
+    tmp_file = session_file.with_name(f".{session_id}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with session_write_lock(session_id):
+        try:
+            tmp_file.write_bytes(orjson.dumps(conversation))
+            os.replace(tmp_file, session_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        session_file.with_suffix(".ndjson").unlink(missing_ok=True)
+
+
+def append_session_log(session_id: str, session_file: Path, conversation: Dict,
+                       new_messages: List[Dict], updated_at: Optional[str] = None) -> bool:
+    """
+    Persist messages just appended to conversation["messages"] as one record
+    in the session's append-only log, instead of rewriting every earlier
+    message. Returns False, writing nothing, when the caller should save the
+    full session instead: it hasn't been saved yet, or the conversation just
+    crossed a multiple of SESSION_COMPACT_INTERVAL and the log is due to be
+    folded into the JSON file. updated_at defaults to now.
+    """
+    messages = conversation["messages"]
+    at = len(messages) - len(new_messages)
+    if not session_file.exists() or at // SESSION_COMPACT_INTERVAL != len(messages) // SESSION_COMPACT_INTERVAL:
+        return False
+
+    conversation["updated_at"] = updated_at or datetime.now(timezone.utc).isoformat()
+    record = {
+        "at": at,
+        "messages": new_messages,
+        "fields": {
+            "updated_at": conversation["updated_at"],
+            "claude_session_id": conversation.get("claude_session_id")
+        }
+    }
+    # One write() on an O_APPEND descriptor, so a record is never interleaved
+    with session_write_lock(session_id), open(session_file.with_suffix(".ndjson"), 'ab') as f:
+        f.write(orjson.dumps(record) + b"\n")
+    return True
+
+
+def _session_summary(data: Dict) -> Dict:
+    """Extract the listing metadata (title, preview, counts...) from a session dict."""
+    # Calculate preview and message count; the preview is the first user message
+    msgs = data.get("messages") or []
+    message_count = len(msgs)
+    preview = next((m.get("content", "")[:100] for m in msgs if m.get("role") == "user"), "")
+
+    return {
+        "session_id": data.get("session_id"),
+        "title": data.get("title", generate_title_from_message(preview)),
+        "created_at": data.get("created_at"),
+        "updated_at": data.get("updated_at"),
+        "message_count": message_count,
+        "preview": preview,
+        "archived": data.get("archived", False),
+        "model": data.get("model", DEFAULT_MODEL)
+    }
+
+
+def _session_signature(snapshot_stat: os.stat_result, log_stat: Optional[os.stat_result]) -> Tuple[int, int]:
+    """(mtime_ns, size) covering a session's snapshot and log, for change detection."""
+    if log_stat is None:
+        return (snapshot_stat.st_mtime_ns, snapshot_stat.st_size)
+    return (max(snapshot_stat.st_mtime_ns, log_stat.st_mtime_ns), snapshot_stat.st_size + log_stat.st_size)
+
+
+def session_signature(session_file: Path) -> Tuple[int, int]:
+    """Stat a session's snapshot and log and return their combined signature."""
+    snapshot_stat = session_file.stat()
+    try:
+        log_stat = session_file.with_suffix(".ndjson").stat()
+    except FileNotFoundError:
+        log_stat = None
+    return _session_signature(snapshot_stat, log_stat)
+
+
+def scan_session_signatures() -> Dict[str, Tuple[int, int]]:
+    """Map every session ID in SESSIONS_DIR to its signature, from one directory scan."""
+    snapshots = {}
+    logs = {}
+    with os.scandir(SESSIONS_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith(".json") and entry.name != SHARES_FILE.name:
+                snapshots[entry.name[:-len(".json")]] = entry.stat()
+            elif entry.name.endswith(".ndjson"):
+                logs[entry.name[:-len(".ndjson")]] = entry.stat()
+    return {
+        session_id: _session_signature(stat, logs.get(session_id))
+        for session_id, stat in snapshots.items()
+    }
+
+
+def _make_excerpt(content: str, query: str) -> Optional[str]:
+    """Return ~50 characters of context around the first match of query, or None."""
+    idx = content.lower().find(query)
+    if idx < 0:
+        return None
+    return _excerpt_at(content, idx, len(query))
+
+
+def _excerpt_at(content: str, idx: int, length: int) -> str:
+    """Return ~50 characters of context around content[idx:idx + length]."""
+    n = len(content)
+    start = max(0, idx - 50)
+    end = min(n, idx + length + 50)
+    prefix = "..." if start else ""
+    suffix = "..." if end < n else ""
+    return f"{prefix}{content[start:end]}{suffix}"
+
+
+# Shared by index syncs and fallback searches; file reads release the GIL, so
+# a cold page cache is read in parallel rather than one file at a time
+_read_executor = ThreadPoolExecutor(thread_name_prefix="session-read")
+
+
+class IndexStore:
+    """
+    SQLite-backed manifest and full-text index of saved conversations.
+
+    ``sessions_meta`` holds the per-session fields the sidebar lists, so
+    listings never open session files (and title search reads it), and
+    ``messages_fts`` (FTS5, one row per message) serves message search.
+    The session files stay the source of truth: both tables are updated on
+    every save and re-synced against the files on disk (by mtime and size),
+    so sessions written by the CLI show up too.
+    """
+
+    # Bump when the schema changes; older databases are rebuilt from the files
+    SCHEMA_VERSION = 3
+    PARALLEL_SYNC_THRESHOLD = 16  # Changed sessions needed before sync reads them on the pool
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_file), check_same_thread=False)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS sessions_meta")
+                self._conn.execute("DROP TABLE IF EXISTS sessions_fts")
+                self._conn.execute("DROP TABLE IF EXISTS messages_fts")
+                self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions_meta (
+                session_id TEXT PRIMARY KEY,
+                title TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                message_count INTEGER NOT NULL,
+                preview TEXT NOT NULL,
+                archived INTEGER NOT NULL,
+                model TEXT,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_message_hash BLOB
+            )
+        """)
+        # Serves the recency ordering (and its cursor) without sorting the table
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS sessions_meta_recent "
+            "ON sessions_meta (COALESCE(updated_at, created_at, ''))"
+        )
+        try:
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    session_id UNINDEXED, msg_idx UNINDEXED, content, tokenize = 'trigram'
+                )
+            """)
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 (or the trigram tokenizer) fall back to scanning files
+            print(f"Search index unavailable, falling back to file scan: {e}")
+            self.fts_enabled = False
+
+    @staticmethod
+    def _message_hash(message: Dict) -> bytes:
+        """Content hash of one message, to tell whether an indexed message is still there."""
+        return hashlib.blake2b(orjson.dumps(message, option=orjson.OPT_SORT_KEYS), digest_size=16).digest()
+
+    def _write(self, session_id: str, data: Dict, signature: Tuple[int, int]) -> None:
+        """
+        Update the rows for one session (caller holds the lock). Messages are
+        only ever appended, so just the ones past the indexed count are added.
+        The conversation is reindexed from scratch when it got shorter or the
+        last indexed message is no longer at its position (history cleared and
+        refilled since the previous update), so the count alone isn't trusted.
+        """
+        summary = _session_summary(data)
+        messages = data.get("messages") or []
+        row = self._conn.execute(
+            "SELECT message_count, last_message_hash FROM sessions_meta WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        indexed, indexed_hash = row if row else (0, None)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions_meta VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, summary["title"], summary["created_at"], summary["updated_at"],
+             summary["message_count"], summary["preview"], summary["archived"],
+             summary["model"], *signature,
+             self._message_hash(messages[-1]) if messages else None)
+        )
+        if self.fts_enabled:
+            if len(messages) < indexed or (
+                indexed and self._message_hash(messages[indexed - 1]) != indexed_hash
+            ):
+                self._conn.execute("DELETE FROM messages_fts WHERE session_id = ?", (session_id,))
+                indexed = 0
+            self._conn.executemany(
+                "INSERT INTO messages_fts (session_id, msg_idx, content) VALUES (?, ?, ?)",
+                ((session_id, idx, msg.get("content", ""))
+                 for idx, msg in enumerate(messages[indexed:], start=indexed))
+            )
+
+    def _delete(self, session_id: str) -> None:
+        """Drop the rows for one session (caller holds the lock)."""
+        self._conn.execute("DELETE FROM sessions_meta WHERE session_id = ?", (session_id,))
+        if self.fts_enabled:
+            self._conn.execute("DELETE FROM messages_fts WHERE session_id = ?", (session_id,))
+
+    def update(self, session_id: str, data: Dict, session_file: Path) -> Tuple[int, int]:
+        """Record a session that was just written to session_file (and its log); returns its signature."""
+        signature = session_signature(session_file)
+        with self._lock, self._conn:
+            self._write(session_id, data, signature)
+        return signature
+
+    def remove(self, session_id: str) -> None:
+        """Forget a deleted session."""
+        with self._lock, self._conn:
+            self._delete(session_id)
+
+    @staticmethod
+    def _load(stale: Tuple[str, Tuple[int, int]]) -> Optional[Dict]:
+        """Read one changed session for sync, or None if it can't be read."""
+        session_id = stale[0]
+        try:
+            return read_session_file(SESSIONS_DIR / f"{session_id}.json")
+        except (OSError, ValueError) as e:
+            print(f"Error loading session {session_id}: {e}")
+            return None
+
+    def sync(self) -> None:
+        """Re-read session files that were added, changed or removed on disk."""
+        on_disk = scan_session_signatures()
+
+        with self._lock, self._conn:
+            known = {
+                row[0]: (row[1], row[2])
+                for row in self._conn.execute("SELECT session_id, mtime_ns, size FROM sessions_meta")
+            }
+
+            stale = [
+                (session_id, signature) for session_id, signature in on_disk.items()
+                if known.get(session_id) != signature
+            ]
+            # A cold start (or a deleted search.db) re-reads every session, so
+            # larger batches are parsed on the pool; SQLite writes stay here
+            if len(stale) >= self.PARALLEL_SYNC_THRESHOLD:
+                loaded = _read_executor.map(self._load, stale)
+            else:
+                loaded = map(self._load, stale)
+            for (session_id, signature), data in zip(stale, loaded):
+                if data is not None:
+                    self._write(session_id, data, signature)
+
+            for session_id in known.keys() - on_disk.keys():
+                self._delete(session_id)
+
+    def list_sessions(self, limit: Optional[int] = None, before: Optional[str] = None) -> List[Dict]:
+        """
+        Return session metadata, most recently updated first. With before, only
+        sessions updated strictly earlier are returned (the cursor for the next
+        page is the last returned session's updated_at); limit caps the page.
+        """
+        sql = (
+            "SELECT session_id, title, created_at, updated_at, message_count, preview, archived, model "
+            "FROM sessions_meta"
+        )
+        params = []
+        if before is not None:
+            sql += " WHERE COALESCE(updated_at, created_at, '') < ?"
+            params.append(before)
+        sql += " ORDER BY COALESCE(updated_at, created_at, '') DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                "session_id": session_id,
+                "title": title,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "message_count": message_count,
+                "preview": preview,
+                "archived": bool(archived),
+                "model": model
+            }
+            for session_id, title, created_at, updated_at, message_count, preview, archived, model in rows
+        ]
+
+    def title_matches(self, query: str) -> List[Dict]:
+        """Find conversations whose title contains query (lowercased), from the manifest alone."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id, title FROM sessions_meta WHERE title IS NOT NULL"
+            ).fetchall()
+        return [
+            {"session_id": session_id, "title": title, "match_type": "title", "excerpt": title}
+            for session_id, title in rows
+            if title and query in title.lower()
+        ]
+
+    def search(self, query: str) -> List[Dict]:
+        """
+        Find conversations whose title or messages contain query (lowercased).
+        Title matches come first; each other conversation is listed once, with
+        an excerpt from its best-ranked matching message. Without FTS5 the
+        message bodies of the remaining conversations are scanned from disk.
+        """
+        results = self.title_matches(query)
+        seen = {result["session_id"] for result in results}
+        if not self.fts_enabled:
+            return results + scan_conversations(query, skip=seen)
+        with self._lock:
+            if len(query) >= 3:
+                # Trigram tokenizer: a quoted phrase is a case-insensitive substring match
+                phrase = '"' + query.replace('"', '""') + '"'
+                rows = self._conn.execute(
+                    "SELECT session_id, title, snippet(messages_fts, 2, '', '', '...', 64) "
+                    "FROM messages_fts JOIN sessions_meta USING (session_id) "
+                    "WHERE messages_fts MATCH ? ORDER BY rank",
+                    (phrase,)
+                ).fetchall()
+            else:
+                # Trigrams can't match fewer than three characters, so filter the
+                # indexed text here instead - still no session files are opened
+                rows = []
+                for session_id, title, content in self._conn.execute(
+                    "SELECT session_id, title, content "
+                    "FROM messages_fts JOIN sessions_meta USING (session_id) ORDER BY messages_fts.rowid"
+                ):
+                    if session_id in seen:
+                        continue
+                    excerpt = _make_excerpt(content, query)
+                    if excerpt is not None:
+                        rows.append((session_id, title, excerpt))
+
+        for session_id, title, excerpt in rows:
+            if session_id in seen:
+                continue
+            seen.add(session_id)
+            results.append({
+                "session_id": session_id,
+                "title": title or None,
+                "match_type": "message",
+                "excerpt": excerpt
+            })
+        return results
+
+
+_MESSAGE_SEPARATOR = "\x1f"  # ASCII unit separator, never typed into the search box
+
+
+def _bytes_match(path: str, prefilter: re.Pattern) -> bool:
+    """Search a file's raw bytes (via mmap); missing or empty files never match."""
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return prefilter.search(mm) is not None
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+def _scan_session_file(path: str, query: str, prefilter: Optional[re.Pattern],
+                       pattern: re.Pattern, unreadable: List[str]) -> Optional[Dict]:
+    """Return a message search hit for one session file, or None (adding it to unreadable on error)."""
+    try:
+        if prefilter is not None and not any(
+            _bytes_match(p, prefilter) for p in (path, path[:-len(".json")] + ".ndjson")
+        ):
+            return None
+        data = read_session_file(Path(path))
+
+        # Search in messages, joined with a separator a query won't contain;
+        # offsets map back to the owning message via the start positions
+        msgs = data.get("messages") or []
+        contents = [msg.get("content", "") for msg in msgs]
+        match = pattern.search(_MESSAGE_SEPARATOR.join(contents))
+        if match is None:
+            return None
+        starts = list(itertools.accumulate((len(c) + 1 for c in contents[:-1]), initial=0))
+        owner = bisect.bisect_right(starts, match.start()) - 1
+        return {
+            "session_id": data.get("session_id"),
+            "title": data.get("title", generate_title_from_message(
+                next((m.get("content", "") for m in msgs if m.get("role") == "user"), "")
+            )),
+            "match_type": "message",
+            "excerpt": _excerpt_at(contents[owner], match.start() - starts[owner], len(match.group()))
+        }
+    except Exception:
+        unreadable.append(os.path.basename(path))
+        return None
+
+
+def scan_conversations(query: str, skip: Set[str] = frozenset()) -> List[Dict]:
+    """
+    Search message bodies by opening every session file (used when the FTS
+    index is unavailable). Title matches are served from the manifest, so
+    sessions listed in skip are not opened at all.
+    """
+    # Most files don't match, so test the raw bytes before paying for a parse.
+    # That is only exact when the query is stored verbatim in the file: ASCII
+    # (so bytes-level IGNORECASE agrees with str.lower) and nothing JSON escapes.
+    prefilter = None
+    if query.isascii() and query.isprintable() and '"' not in query and '\\' not in query:
+        prefilter = re.compile(re.escape(query.encode('ascii')), re.IGNORECASE)
+
+    # One C-level regex scan over all of a session's messages instead of a
+    # Python-level substring test per message
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+
+    # Files holding fewer bytes than the query has characters can't contain it
+    paths = [
+        os.path.join(SESSIONS_DIR, f"{session_id}.json")
+        for session_id, (_, size) in scan_session_signatures().items()
+        if session_id not in skip and size >= len(query)
+    ]
+
+    unreadable = []
+    hits = _read_executor.map(
+        lambda path: _scan_session_file(path, query, prefilter, pattern, unreadable), paths
+    )
+    results = [hit for hit in hits if hit is not None]
+    # One line per search rather than a print per bad file
+    if unreadable:
+        print(f"Search skipped {len(unreadable)} unreadable session file(s): {', '.join(sorted(unreadable))}")
+    return results
+
+
+def _read_text_deltas(stdout) -> Iterator[str]:
+    """
+    Read Claude Code stream-json events from stdout, yielding the text deltas
+    of one response. Stops after the turn's result event, which is the
+    generator's return value (None if stdout ended first).
+    """
+    for line in stdout:
+        try:
+            event = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue
+        if event.get("type") == "stream_event":
+            delta = event.get("event", {}).get("delta", {})
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                yield delta["text"]
+        elif event.get("type") == "result":
+            return event
+    return None
+
+
+def stream_claude(cmd: List[str], timeout: float) -> Iterator[str]:
+    """
+    Run a Claude Code command with --output-format stream-json (and partial
+    messages), yielding response text as it arrives. The generator's return
+    value is a dict with "returncode", "stderr", "timed_out" and "result" (the
+    final result event, or None). Closing the generator early kills Claude.
+    """
+    timed_out = threading.Event()
+    # stderr goes to a temp file so a chatty stderr can't fill its pipe and
+    # stall the stdout reader
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            text=True,
+            bufsize=1
+        )
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        # The timeout bounds the whole response, not each read
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+        try:
+            result_event = yield from _read_text_deltas(process.stdout)
+            process.stdout.read()  # Nothing follows the result event; drain to be sure
+            process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode('utf-8', errors='replace')
+
+    return {
+        "returncode": process.returncode,
+        "stderr": stderr,
+        "timed_out": timed_out.is_set(),
+        "result": result_event
+    }
+
+
+class PersistentClaude:
+    """
+    A long-running Claude Code process (--input-format stream-json) that is
+    sent one user message per turn on stdin, so a conversation pays Claude
+    Code's startup once instead of once per message.
+    """
+
+    def __init__(self, cmd: List[str]):
+        self._stderr_file = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr_file,
+            text=True,
+            bufsize=1
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def send(self, message: str, timeout: float) -> Iterator[str]:
+        """
+        Send one message and yield the response text, like stream_claude; the
+        return value has the same keys, with "returncode" None while the
+        process is still running. A turn that doesn't finish (timeout, early
+        close, process exit) kills the process, since its state is unknown.
+        """
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            self.process.kill()
+
+        timer = threading.Timer(timeout, kill_on_timeout)
+        timer.start()
+        result_event = None
+        try:
+            line = orjson.dumps({"type": "user", "message": {"role": "user", "content": message}})
+            try:
+                self.process.stdin.write(line.decode() + "\n")
+                self.process.stdin.flush()
+            except OSError:
+                pass  # Already exited; reported below as a missing result
+            else:
+                result_event = yield from _read_text_deltas(self.process.stdout)
+        finally:
+            timer.cancel()
+            if result_event is None:
+                if self.process.poll() is None:
+                    self.process.kill()
+                self.close()
+
+        stderr = ""
+        if result_event is None:
+            self._stderr_file.seek(0)
+            stderr = self._stderr_file.read().decode('utf-8', errors='replace')
+        return {
+            "returncode": self.process.poll(),
+            "stderr": stderr,
+            "timed_out": timed_out.is_set(),
+            "result": result_event
+        }
+
+    def close(self) -> None:
+        """End the process: closing stdin lets it exit on its own, else it is killed."""
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
@@ -7,99 +7,234 @@ import argparse
 import json
 import re
 import secrets
+import sqlite3
 import subprocess
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 
-from flask import Flask, render_template, request, jsonify, session, send_file, redirect, Response, stream_with_context
+from flask import Flask, render_template, request, jsonify, session, send_file, redirect, Response, stream_with_context, make_response
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import os
 
+from _core import (
+    CLAUDE_BIN,
+    DEFAULT_MODEL,
+    SEARCH_INDEX_FILE,
+    SESSIONS_DIR,
+    SHARES_FILE,
+    SYSTEM_PROMPT,
+    IndexStore,
+    append_session_log,
+    delete_session_files,
+    generate_title_from_message,
+    read_session_file,
+    session_digest,
+    session_signature,
+    stream_claude,
+    write_session_file,
+)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Encode jsonify() responses with orjson; keys stay sorted as with Flask's default."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-in-production'  # Change this in production!
+app.json = OrjsonProvider(app)
+# Public origin for share links (e.g. https://chat.example.com); defaults to the request's host
+app.config['SHARE_BASE_URL'] = os.environ.get('SHARE_BASE_URL', '').rstrip('/') or None
+# Behind Apache/lighttpd, hand export bodies to the front-end server via X-Sendfile
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+
+# Gzip JSON and HTML responses when flask-compress is installed (optional).
+# Streams are left alone so /api/chat/stream events are not held in a buffer.
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+if Compress is not None:
+    app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html']
+    app.config['COMPRESS_LEVEL'] = 6
+    app.config['COMPRESS_MIN_SIZE'] = 500
+    app.config['COMPRESS_STREAMS'] = False
+    Compress(app)
 
 # Configuration
-SESSIONS_DIR = Path(__file__).parent / "sessions"
-SESSIONS_DIR.mkdir(exist_ok=True)
-SHARES_FILE = SESSIONS_DIR / "shares.json"
+_SESSIONS_PREFIX = str(SESSIONS_DIR) + os.sep
+SHARES_DB_FILE = SESSIONS_DIR / "shares.db"
+SECRET_KEY_FILE = SESSIONS_DIR / ".secret_key"
 PAUL_GRAHAM_DIR = Path(__file__).parent.parent / "paul-graham" / "data"
 ESSAYS_INDEX_FILE = PAUL_GRAHAM_DIR / "index.json"
 ESSAYS_DIR = PAUL_GRAHAM_DIR / "essays"
 CLAUDE_TIMEOUT = 600  # 10 minute timeout for Claude responses
-DEFAULT_MODEL = "sonnet"
-SYSTEM_PROMPT = "You are a helpful AI assistant. Respond to the user's message naturally and conversationally."
+MANAGER_CACHE_SIZE = 128  # Loaded conversations kept in memory between requests
+SESSION_FSYNC_INTERVAL = 2.0  # Seconds between batched fsyncs of written session files
+
+
+def load_secret_key() -> str:
+    """
+    Secret for signing the session cookie: FLASK_SECRET_KEY if set, otherwise
+    a random key generated once and kept in SECRET_KEY_FILE, so every worker
+    process and restart signs cookies the same way.
+    """
+    key = os.environ.get('FLASK_SECRET_KEY')
+    if key:
+        return key
+    key = _read_secret_key()
+    if key:
+        return key
+    # Write the key to a private temp file and hard-link it into place: the
+    # link either creates SECRET_KEY_FILE complete or fails because another
+    # worker's key is already there, so no reader can see a half-written file
+    tmp_file = SECRET_KEY_FILE.with_name(f"{SECRET_KEY_FILE.name}.{os.getpid()}.tmp")
+    key = secrets.token_hex(32)
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(key)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_file, SECRET_KEY_FILE)
+        except FileExistsError:
+            key = _read_secret_key()
+            if not key:
+                raise RuntimeError(f"{SECRET_KEY_FILE} exists but is empty")
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    return key
+
+
+def _read_secret_key(attempts: int = 20) -> Optional[str]:
+    """
+    Key stored in SECRET_KEY_FILE, or None if there is none. An empty file is
+    treated as not yet written and re-read for a moment before giving up.
+    """
+    for _ in range(attempts):
+        try:
+            key = SECRET_KEY_FILE.read_text().strip()
+        except FileNotFoundError:
+            return None
+        if key:
+            return key
+        time.sleep(0.05)
+    return None
+
+
+app.secret_key = load_secret_key()
 
 # Auto Context Enrichment Configuration
 AUTO_CONTEXT_ENRICHMENT = True  # Automatically enrich responses with relevant PG essays
 MAX_CONTEXT_ESSAYS = 3  # Maximum number of essays to include in context
 
 
-def generate_title_from_message(message: str, max_length: int = 50) -> str:
-    """Generate a conversation title from the first message."""
-    if not message:
-        return "New Conversation"
-    # Truncate and add ellipsis if too long
-    if len(message) > max_length:
-        return message[:max_length].strip() + "..."
-    return message.strip()
+def _session_path(session_id: str, suffix: str = ".json") -> str:
+    """Path of a session file as a plain string, for routes that only need to stat or send it."""
+    return _SESSIONS_PREFIX + session_id + suffix
 
 
-def get_all_sessions() -> List[Dict]:
-    """Get metadata for all saved sessions."""
-    sessions = []
-    for session_file in SESSIONS_DIR.glob("*.json"):
-        try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Calculate preview and message count
-                message_count = len(data.get("messages", []))
-                preview = ""
-                if message_count > 0:
-                    # Get first user message as preview
-                    for msg in data.get("messages", []):
-                        if msg.get("role") == "user":
-                            preview = msg.get("content", "")[:100]
-                            break
-
-                sessions.append({
-                    "session_id": data.get("session_id"),
-                    "title": data.get("title", generate_title_from_message(preview)),
-                    "created_at": data.get("created_at"),
-                    "updated_at": data.get("updated_at"),
-                    "message_count": message_count,
-                    "preview": preview,
-                    "archived": data.get("archived", False),
-                    "model": data.get("model", DEFAULT_MODEL)
-                })
-        except Exception as e:
-            print(f"Error loading session {session_file}: {e}")
-            continue
+_dirty_files: Set[str] = set()
+_dirty_lock = threading.Lock()
+_flusher: Optional[threading.Thread] = None
 
-    # Sort by updated_at (most recent first), handle None values
-    sessions.sort(key=lambda x: x.get("updated_at") or x.get("created_at") or "", reverse=True)
-    return sessions
 
+def _mark_dirty(path: Path) -> None:
+    """Queue a just-written session file for the next batched fsync."""
+    global _flusher
+    with _dirty_lock:
+        _dirty_files.add(str(path))
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_dirty_files, name="session-fsync", daemon=True)
+            _flusher.start()
+
+
+def _flush_dirty_files() -> None:
+    """
+    Every SESSION_FSYNC_INTERVAL seconds, fsync the session files written since
+    the last pass and then the sessions directory (for the renames) once, so
+    the fsync cost stays bounded however fast messages arrive.
+    """
+    while True:
+        time.sleep(SESSION_FSYNC_INTERVAL)
+        with _dirty_lock:
+            paths = list(_dirty_files)
+            _dirty_files.clear()
+        if not paths:
+            continue
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # Deleted, or a log already folded into its snapshot
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass  # Not supported on a read-only handle on every platform
+            finally:
+                os.close(fd)
+        if hasattr(os, "O_DIRECTORY"):
+            try:
+                fd = os.open(SESSIONS_DIR, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"Error syncing {SESSIONS_DIR}: {e}")
+
+
+def get_all_sessions(limit: Optional[int] = None, before: Optional[str] = None) -> List[Dict]:
+    """Get metadata for saved sessions (from the manifest, not the session files)."""
+    index_store.sync()
+    return index_store.list_sessions(limit=limit, before=before)
+
+
+def _open_shares_db() -> sqlite3.Connection:
+    """Open the share registry, importing a legacy shares.json on first use."""
+    conn = sqlite3.connect(str(SHARES_DB_FILE), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS shares (
+                token TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL UNIQUE,
+                created_at TEXT,
+                read_only INTEGER NOT NULL DEFAULT 1
+            )
+        """)
 
-def load_shares() -> Dict:
-    """Load the shares registry from file."""
     if SHARES_FILE.exists():
         try:
-            with open(SHARES_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            legacy = orjson.loads(SHARES_FILE.read_bytes())
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO shares VALUES (?, ?, ?, ?)",
+                    [(token, data["session_id"], data.get("created_at"), int(data.get("read_only", True)))
+                     for token, data in legacy.items() if data.get("session_id")]
+                )
+            SHARES_FILE.rename(SHARES_FILE.with_name(SHARES_FILE.name + ".migrated"))
+            print(f"Imported {len(legacy)} share(s) from {SHARES_FILE.name}")
         except Exception as e:
-            print(f"Error loading shares: {e}")
-            return {}
-    return {}
+            print(f"Error importing shares: {e}")
+    return conn
 
 
-def save_shares(shares: Dict):
-    """Save the shares registry to file."""
-    try:
-        with open(SHARES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(shares, f, indent=2)
-    except Exception as e:
-        print(f"Error saving shares: {e}")
+_shares_conn = _open_shares_db()
+_shares_lock = threading.Lock()
 
 
 def generate_share_token() -> str:
@@ -109,32 +244,53 @@ def generate_share_token() -> str:
 
 def create_share_link(session_id: str) -> str:
     """Create a shareable link for a conversation."""
-    shares = load_shares()
-
-    # Check if there's already a share token for this session
-    for token, data in shares.items():
-        if data.get("session_id") == session_id:
+    with _shares_lock, _shares_conn:
+        # Check if there's already a share token for this session
+        row = _shares_conn.execute(
+            "SELECT token FROM shares WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row:
             # Return existing token
-            return token
+            return row[0]
 
-    # Generate new token
-    token = generate_share_token()
-    shares[token] = {
-        "session_id": session_id,
-        "created_at": datetime.now(timezone.utc).isoformat(),
-        "read_only": True
-    }
-    save_shares(shares)
-    return token
+        # Generate new token
+        token = generate_share_token()
+        _shares_conn.execute(
+            "INSERT INTO shares (token, session_id, created_at, read_only) VALUES (?, ?, ?, 1)",
+            (token, session_id, datetime.now(timezone.utc).isoformat())
+        )
+        return token
 
 
 def get_session_from_token(token: str) -> Optional[str]:
     """Get session ID from share token."""
-    shares = load_shares()
-    share_data = shares.get(token)
-    if share_data:
-        return share_data.get("session_id")
-    return None
+    with _shares_lock:
+        row = _shares_conn.execute(
+            "SELECT session_id FROM shares WHERE token = ?", (token,)
+        ).fetchone()
+    return row[0] if row else None
+
+
+@lru_cache(maxsize=1024)
+def _resolve_share_token(token: str) -> str:
+    """
+    Cached get_session_from_token. Tokens are never reassigned, so hits can be
+    kept; unknown tokens raise KeyError, which lru_cache does not memoize.
+    """
+    session_id = get_session_from_token(token)
+    if not session_id:
+        raise KeyError(token)
+    return session_id
+
+
+@lru_cache(maxsize=256)
+def _render_shared_conversation(token: str, session_id: str, signature: Tuple[int, int]) -> str:
+    """
+    Rendered read-only share page. Keyed by the session file signature, so any
+    save changes the key and the stale page simply ages out of the LRU.
+    """
+    data = read_session_file(SESSIONS_DIR / f"{session_id}.json")
+    return render_template('shared.html', conversation=data, token=token)
 
 
 def load_essays_index() -> List[Dict]:
@@ -142,15 +298,14 @@ def load_essays_index() -> List[Dict]:
     try:
         if not ESSAYS_INDEX_FILE.exists():
             return []
-        with open(ESSAYS_INDEX_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # index.json has structure: {"essays": [...], "total_count": N, "last_updated": "..."}
-            if isinstance(data, dict) and 'essays' in data:
-                return data['essays']
-            elif isinstance(data, list):
-                return data
-            else:
-                return []
+        data = orjson.loads(ESSAYS_INDEX_FILE.read_bytes())
+        # index.json has structure: {"essays": [...], "total_count": N, "last_updated": "..."}
+        if isinstance(data, dict) and 'essays' in data:
+            return data['essays']
+        elif isinstance(data, list):
+            return data
+        else:
+            return []
     except Exception as e:
         print(f"Error loading essays index: {e}")
         return []
@@ -268,7 +423,7 @@ Return up to {limit} results. Only include essays with relevance_score >= 5.0.""
         # Call Claude Code CLI in headless mode, using stdin to avoid "argument list too long" error
         result = subprocess.run(
             [
-                "claude",
+                CLAUDE_BIN,
                 "--output-format", "json",
                 "--model", "haiku"  # Fast, cheap model for search
             ],
@@ -378,28 +533,91 @@ def _fallback_search(query: str, essays: List[Dict], limit: int) -> List[Dict]:
     return results[:limit]
 
 
+index_store = IndexStore(SEARCH_INDEX_FILE)
+
+
 class ConversationManager:
     """Manages conversation history and Claude Code interaction."""
 
+    # Most recently used managers by session ID, reused while their files are unchanged
+    _cache: "OrderedDict[str, ConversationManager]" = OrderedDict()
+    _cache_lock = threading.Lock()
+
     def __init__(self, session_id: str, model: str = DEFAULT_MODEL):
         self.session_id = session_id
         self.model = model
         self.session_file = SESSIONS_DIR / f"{session_id}.json"
+        self.log_file = SESSIONS_DIR / f"{session_id}.ndjson"
+        # Held across each change to the conversation and its save, since
+        # concurrent requests for a session share this cached manager
+        self._lock = threading.Lock()
+        self._signature = self._current_signature()
         self.conversation = self._load_or_create_session()
+        # Content hash of what's on disk; None when unknown (e.g. after an append)
+        self._digest: Optional[bytes] = session_digest(self.conversation) if self._signature else None
+
+    @classmethod
+    def get(cls, session_id: str, model: str = DEFAULT_MODEL) -> "ConversationManager":
+        """
+        Return the cached manager for session_id if its files haven't changed
+        since it last loaded or saved them (e.g. written by the CLI), else load it.
+        """
+        with cls._cache_lock:
+            manager = cls._cache_hit(session_id, model)
+            if manager is not None:
+                return manager
+        # Load outside the lock so reading one session's file doesn't hold up
+        # requests for every other session
+        loaded = cls(session_id, model)
+        with cls._cache_lock:
+            # Another request may have loaded it meanwhile; share that one so
+            # there is a single manager (and lock) per session
+            manager = cls._cache_hit(session_id, model)
+            if manager is not None:
+                return manager
+            cls._cache[session_id] = loaded
+            if len(cls._cache) > MANAGER_CACHE_SIZE:
+                cls._cache.popitem(last=False)
+            return loaded
+
+    @classmethod
+    def _cache_hit(cls, session_id: str, model: str) -> Optional["ConversationManager"]:
+        """The cached manager for session_id if still current; call with _cache_lock held."""
+        manager = cls._cache.get(session_id)
+        if manager is None:
+            return None
+        # A manager in the middle of a save is the one changing the files
+        if not manager._lock.locked() and manager._signature != manager._current_signature():
+            return None
+        cls._cache.move_to_end(session_id)
+        manager.model = model
+        return manager
+
+    @classmethod
+    def forget(cls, session_id: str) -> None:
+        """Drop a cached manager (after its session is deleted)."""
+        with cls._cache_lock:
+            cls._cache.pop(session_id, None)
+
+    def _current_signature(self) -> Optional[Tuple[int, int]]:
+        """Signature of the session's files on disk, or None if it hasn't been saved yet."""
+        try:
+            return session_signature(self.session_file)
+        except FileNotFoundError:
+            return None
 
     def _load_or_create_session(self) -> Dict:
         """Load existing session or create new one."""
         if self.session_file.exists():
-            with open(self.session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Add default values for new fields if missing (backward compatibility)
-                if "title" not in data:
-                    data["title"] = None
-                if "archived" not in data:
-                    data["archived"] = False
-                if "claude_session_id" not in data:
-                    data["claude_session_id"] = None
-                return data
+            data = read_session_file(self.session_file)
+            # Add default values for new fields if missing (backward compatibility)
+            if "title" not in data:
+                data["title"] = None
+            if "archived" not in data:
+                data["archived"] = False
+            if "claude_session_id" not in data:
+                data["claude_session_id"] = None
+            return data
         else:
             return {
                 "session_id": self.session_id,
@@ -411,11 +629,35 @@ class ConversationManager:
                 "messages": []
             }
 
-    def _save_session(self) -> None:
-        """Save session to disk."""
-        self.conversation["updated_at"] = datetime.now(timezone.utc).isoformat()
-        with open(self.session_file, 'w', encoding='utf-8') as f:
-            json.dump(self.conversation, f, ensure_ascii=False, indent=2)
+    def _save_session(self, updated_at: Optional[str] = None) -> None:
+        """
+        Save the full session to disk, folding in (and removing) its append-only
+        log. Skipped when nothing changed since it was loaded or last saved
+        (clearing an empty chat, re-setting the same title...), so the file's
+        signature, and every cache keyed on it, stays valid.
+        """
+        digest = session_digest(self.conversation)
+        if digest == self._digest and self.session_file.exists():
+            return
+        self.conversation["updated_at"] = updated_at or datetime.now(timezone.utc).isoformat()
+        write_session_file(self.session_id, self.session_file, self.conversation)
+        _mark_dirty(self.session_file)
+        self._digest = digest
+        self._signature = index_store.update(self.session_id, self.conversation, self.session_file)
+
+    def _append_messages(self, new_messages: List[Dict], updated_at: Optional[str] = None) -> None:
+        """
+        Persist messages just appended to the conversation as one record in the
+        session's append-only log, instead of rewriting every earlier message.
+        The log is compacted into the JSON file every SESSION_COMPACT_INTERVAL
+        messages (and by any full save).
+        """
+        if not append_session_log(self.session_id, self.session_file, self.conversation, new_messages, updated_at):
+            self._save_session(updated_at)
+            return
+        _mark_dirty(self.log_file)
+        self._digest = None  # Not worth hashing the whole conversation per turn
+        self._signature = index_store.update(self.session_id, self.conversation, self.session_file)
 
     def _build_message_with_context(self, user_message: str, injected_context: Optional[Dict] = None) -> str:
         """
@@ -480,24 +722,7 @@ class ConversationManager:
 
         # Check if this is the first message or a follow-up
         claude_session_id = self.conversation.get("claude_session_id")
-
-        if not claude_session_id:
-            # First message: Create new Claude Code session
-            cmd = [
-                "claude",
-                "-p", message_to_send,
-                "--output-format", "json",
-                "--model", self.model,
-                "--append-system-prompt", SYSTEM_PROMPT
-            ]
-        else:
-            # Follow-up message: Resume existing Claude Code session
-            cmd = [
-                "claude",
-                "--resume", claude_session_id,
-                message_to_send,
-                "--output-format", "json"
-            ]
+        cmd = self._claude_command(message_to_send, claude_session_id, "json")
 
         try:
             result = subprocess.run(
@@ -525,108 +750,206 @@ class ConversationManager:
                     "response": f"Error: Failed to parse response from Claude"
                 }
 
-            # Extract response and metadata
-            # Claude Code returns 'result' field, not 'response'
-            response = response_data.get('result', '').strip()
-
-            # Store Claude Code's session ID (from first response)
-            if 'session_id' in response_data:
-                self.conversation["claude_session_id"] = response_data['session_id']
-
-            # Extract token usage from Claude Code response
-            usage_data = response_data.get('usage', {})
-            model_usage = response_data.get('modelUsage', {})
-
-            # Build rich debug info
-            debug_info = {
-                "session_management": {
-                    "claude_session_id": self.conversation.get("claude_session_id"),
-                    "our_session_id": self.session_id,
-                    "is_first_message": claude_session_id is None,
-                    "model": self.model
-                },
-                "message_flow": {
-                    "user_message_original": user_message,
-                    "message_sent_to_claude": message_to_send,
-                    "message_length": len(message_to_send),
-                    "context_injected": injected_context is not None,
-                    "injected_context": injected_context if injected_context else None
-                },
-                "performance": {
-                    "token_cost": response_data.get('total_cost_usd'),
-                    "duration_ms": response_data.get('duration_ms'),
-                    "turn_count": response_data.get('num_turns'),
-                    "response_length": len(response)
-                },
-                "token_usage": {
-                    "input_tokens": usage_data.get('input_tokens', 0),
-                    "output_tokens": usage_data.get('output_tokens', 0),
-                    "cache_creation_tokens": usage_data.get('cache_creation_input_tokens', 0),
-                    "cache_read_tokens": usage_data.get('cache_read_input_tokens', 0),
-                    "total_tokens": (
-                        usage_data.get('input_tokens', 0) +
-                        usage_data.get('output_tokens', 0) +
-                        usage_data.get('cache_creation_input_tokens', 0)
-                    ),
-                    "model_usage": model_usage
-                },
-                "metadata": {
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "system_prompt": SYSTEM_PROMPT,
-                    "conversation_context": "Managed by Claude Code via --resume"
-                }
+            return self._record_exchange(user_message, message_to_send, injected_context,
+                                         enrichment_steps, response_data, claude_session_id)
+
+        except subprocess.TimeoutExpired:
+            return {
+                "success": False,
+                "error": "Request timed out",
+                "response": "Error: Request timed out. Please try again."
+            }
+        except Exception as e:
+            error_msg = str(e)
+            return {
+                "success": False,
+                "error": error_msg,
+                "response": f"Error: {error_msg}"
             }
 
-            # Prepare context metadata for user message
-            context_metadata = None
-            if injected_context and 'essays' in injected_context:
-                context_metadata = {
-                    "essays_included": [essay.get('file', essay.get('title', 'unknown'))
-                                       for essay in injected_context['essays']],
-                    "context_type": "essay_retrieval",
-                    "essay_count": len(injected_context['essays'])
-                }
+    def _claude_command(self, message_to_send: str, claude_session_id: Optional[str],
+                        output_format: str) -> List[str]:
+        """Build the Claude Code command for a new or resumed conversation."""
+        if not claude_session_id:
+            # First message: Create new Claude Code session
+            return [
+                CLAUDE_BIN,
+                "-p", message_to_send,
+                "--output-format", output_format,
+                "--model", self.model,
+                "--append-system-prompt", SYSTEM_PROMPT
+            ]
+        # Follow-up message: Resume existing Claude Code session
+        return [
+            CLAUDE_BIN,
+            "--resume", claude_session_id,
+            message_to_send,
+            "--output-format", output_format
+        ]
+
+    def _record_exchange(self, user_message: str, message_to_send: str, injected_context: Optional[Dict],
+                         enrichment_steps: Optional[List], response_data: Dict,
+                         claude_session_id: Optional[str]) -> Dict:
+        """
+        Save a completed exchange from Claude Code's JSON result and build the
+        ask_claude return value.
 
-            # Save messages to conversation history
-            user_msg_data = {
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            }
-            if context_metadata:
-                user_msg_data["context_metadata"] = context_metadata
+        Args:
+            user_message: The user's question/message
+            message_to_send: The message actually sent to Claude (with any context)
+            injected_context: Optional context that was injected
+            enrichment_steps: Optional list of enrichment steps to save with message
+            response_data: The result object from Claude Code's JSON output
+            claude_session_id: Claude session ID before this exchange (None if first)
 
-            self.conversation["messages"].append(user_msg_data)
+        Returns:
+            dict with 'success', 'response' and 'debug_info'
+        """
+        # Extract response and metadata
+        # Claude Code returns 'result' field, not 'response'
+        response = response_data.get('result', '').strip()
+        # One timestamp for the whole exchange (debug info and both messages)
+        now = datetime.now(timezone.utc).isoformat()
+
+        # Claude Code's session ID (from first response), stored below
+        new_claude_session_id = response_data.get('session_id', self.conversation.get("claude_session_id"))
+
+        # Extract token usage from Claude Code response
+        usage_data = response_data.get('usage', {})
+        model_usage = response_data.get('modelUsage', {})
+
+        # Build rich debug info
+        debug_info = {
+            "session_management": {
+                "claude_session_id": new_claude_session_id,
+                "our_session_id": self.session_id,
+                "is_first_message": claude_session_id is None,
+                "model": self.model
+            },
+            "message_flow": {
+                "user_message_original": user_message,
+                "message_sent_to_claude": message_to_send,
+                "message_length": len(message_to_send),
+                "context_injected": injected_context is not None,
+                "injected_context": injected_context if injected_context else None
+            },
+            "performance": {
+                "token_cost": response_data.get('total_cost_usd'),
+                "duration_ms": response_data.get('duration_ms'),
+                "turn_count": response_data.get('num_turns'),
+                "response_length": len(response)
+            },
+            "token_usage": {
+                "input_tokens": usage_data.get('input_tokens', 0),
+                "output_tokens": usage_data.get('output_tokens', 0),
+                "cache_creation_tokens": usage_data.get('cache_creation_input_tokens', 0),
+                "cache_read_tokens": usage_data.get('cache_read_input_tokens', 0),
+                "total_tokens": (
+                    usage_data.get('input_tokens', 0) +
+                    usage_data.get('output_tokens', 0) +
+                    usage_data.get('cache_creation_input_tokens', 0)
+                ),
+                "model_usage": model_usage
+            },
+            "metadata": {
+                "timestamp": now,
+                "system_prompt": SYSTEM_PROMPT,
+                "conversation_context": "Managed by Claude Code via --resume"
+            }
+        }
 
-            assistant_msg_data = {
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "debug_info": debug_info
+        # Prepare context metadata for user message
+        context_metadata = None
+        if injected_context and 'essays' in injected_context:
+            context_metadata = {
+                "essays_included": [essay.get('file', essay.get('title', 'unknown'))
+                                   for essay in injected_context['essays']],
+                "context_type": "essay_retrieval",
+                "essay_count": len(injected_context['essays'])
             }
-            if enrichment_steps:
-                assistant_msg_data["enrichment_steps"] = enrichment_steps
 
+        # Save messages to conversation history
+        user_msg_data = {
+            "role": "user",
+            "content": user_message,
+            "timestamp": now
+        }
+        if context_metadata:
+            user_msg_data["context_metadata"] = context_metadata
+
+        assistant_msg_data = {
+            "role": "assistant",
+            "content": response,
+            "timestamp": now,
+            "debug_info": debug_info
+        }
+        if enrichment_steps:
+            assistant_msg_data["enrichment_steps"] = enrichment_steps
+
+        with self._lock:
+            self.conversation["claude_session_id"] = new_claude_session_id
+            self.conversation["messages"].append(user_msg_data)
             self.conversation["messages"].append(assistant_msg_data)
 
             # Auto-generate title from first message if not set
             if not self.conversation.get("title") and len(self.conversation["messages"]) == 2:
                 self.conversation["title"] = generate_title_from_message(user_message)
+                self._save_session(now)
+            else:
+                self._append_messages([user_msg_data, assistant_msg_data], now)
 
-            self._save_session()
+        return {
+            "success": True,
+            "response": response,
+            "debug_info": debug_info
+        }
 
-            return {
-                "success": True,
-                "response": response,
-                "debug_info": debug_info
-            }
+    def ask_claude_stream(self, user_message: str, injected_context: Optional[Dict] = None,
+                          enrichment_steps: Optional[List] = None):
+        """
+        Streaming variant of ask_claude.
+
+        Yields the response text in chunks as Claude Code produces it, then
+        returns (as the generator's return value) the same dict as ask_claude.
+        Uses --output-format stream-json with partial messages; its final
+        'result' event carries the same fields as the json output format.
+        If the generator is closed early the Claude process is killed and
+        nothing is saved.
+        """
+        message_to_send = self._build_message_with_context(user_message, injected_context)
+        claude_session_id = self.conversation.get("claude_session_id")
+        cmd = self._claude_command(message_to_send, claude_session_id, "stream-json")
+        cmd += ["--verbose", "--include-partial-messages"]
+
+        try:
+            outcome = yield from stream_claude(cmd, CLAUDE_TIMEOUT)
+
+            if outcome["timed_out"]:
+                return {
+                    "success": False,
+                    "error": "Request timed out",
+                    "response": "Error: Request timed out. Please try again."
+                }
+
+            if outcome["returncode"] != 0:
+                error_msg = outcome["stderr"] or "Unknown error occurred"
+                return {
+                    "success": False,
+                    "error": error_msg,
+                    "response": f"Error: {error_msg}"
+                }
+
+            response_data = outcome["result"]
+            if response_data is None:
+                return {
+                    "success": False,
+                    "error": "Claude response ended without a result",
+                    "response": "Error: Failed to parse response from Claude"
+                }
+
+            return self._record_exchange(user_message, message_to_send, injected_context,
+                                         enrichment_steps, response_data, claude_session_id)
 
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "error": "Request timed out",
-                "response": "Error: Request timed out. Please try again."
-            }
         except Exception as e:
             error_msg = str(e)
             return {
@@ -641,18 +964,21 @@ class ConversationManager:
 
     def clear_history(self) -> None:
         """Clear conversation history."""
-        self.conversation["messages"] = []
-        self._save_session()
+        with self._lock:
+            self.conversation["messages"] = []
+            self._save_session()
 
     def update_title(self, title: str) -> None:
         """Update conversation title."""
-        self.conversation["title"] = title
-        self._save_session()
+        with self._lock:
+            self.conversation["title"] = title
+            self._save_session()
 
     def update_archived(self, archived: bool) -> None:
         """Update archived status."""
-        self.conversation["archived"] = archived
-        self._save_session()
+        with self._lock:
+            self.conversation["archived"] = archived
+            self._save_session()
 
     def get_metadata(self) -> Dict:
         """Get conversation metadata."""
@@ -774,7 +1100,7 @@ def chat():
     session['session_id'] = session_id
 
     # Process message with context (manual or auto)
-    manager = ConversationManager(session_id, model)
+    manager = ConversationManager.get(session_id, model)
     result = manager.ask_claude(user_message, injected_context=context)
 
     # Add context enrichment info to debug data
@@ -902,9 +1228,17 @@ def chat_stream():
             if progress_steps and len(progress_steps) > 0:
                 progress_steps[-1]['status'] = 'completed'
 
-            # Process message with Claude (pass progress_steps for persistence)
-            manager = ConversationManager(session_id, model)
-            result = manager.ask_claude(user_message, injected_context=context, enrichment_steps=progress_steps if progress_steps else None)
+            # Process message with Claude (pass progress_steps for persistence),
+            # forwarding the answer text as it is generated
+            manager = ConversationManager.get(session_id, model)
+            answer_stream = manager.ask_claude_stream(user_message, injected_context=context, enrichment_steps=progress_steps if progress_steps else None)
+            while True:
+                try:
+                    text = next(answer_stream)
+                except StopIteration as done:
+                    result = done.value
+                    break
+                yield f"data: {json.dumps({'type': 'delta', 'text': text})}\n\n"
 
             # Add context enrichment info to debug data
             if context_metadata and 'debug_info' in result:
@@ -1004,7 +1338,7 @@ def get_context():
         })
 
     model = request.args.get('model', DEFAULT_MODEL)
-    manager = ConversationManager(session_id, model)
+    manager = ConversationManager.get(session_id, model)
     history = manager.get_history()
 
     # Analyze context from conversation history
@@ -1096,7 +1430,7 @@ def get_history():
         return jsonify({"messages": []})
 
     model = request.args.get('model', DEFAULT_MODEL)
-    manager = ConversationManager(session_id, model)
+    manager = ConversationManager.get(session_id, model)
     history = manager.get_history()
 
     return jsonify({"messages": history})
@@ -1110,7 +1444,7 @@ def clear_history():
         return jsonify({"success": True})
 
     model = request.args.get('model', DEFAULT_MODEL)
-    manager = ConversationManager(session_id, model)
+    manager = ConversationManager.get(session_id, model)
     manager.clear_history()
 
     return jsonify({"success": True})
@@ -1118,10 +1452,22 @@ def clear_history():
 
 @app.route('/api/conversations', methods=['GET'])
 def get_conversations():
-    """Get list of all conversations."""
+    """
+    Get list of conversations, newest first. Optional ?limit=N&before=<updated_at>
+    pages through them; next_before is the cursor for the following page.
+    """
     try:
-        sessions = get_all_sessions()
-        return jsonify({"success": True, "conversations": sessions})
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit <= 0:
+            return jsonify({"success": False, "error": "limit must be positive"}), 400
+        before = request.args.get('before') or None
+
+        sessions = get_all_sessions(limit=limit, before=before)
+        next_before = None
+        if limit is not None and len(sessions) == limit:
+            last = sessions[-1]
+            next_before = last["updated_at"] or last["created_at"] or ""
+        return jsonify({"success": True, "conversations": sessions, "next_before": next_before})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -1137,7 +1483,7 @@ def new_conversation():
         # Create new conversation manager (this will create the session file)
         data = request.get_json() or {}
         model = data.get('model', DEFAULT_MODEL)
-        manager = ConversationManager(new_session_id, model)
+        manager = ConversationManager.get(new_session_id, model)
 
         return jsonify({
             "success": True,
@@ -1153,8 +1499,9 @@ def switch_conversation(session_id):
     """Switch to a different conversation."""
     try:
         # Check if session exists
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        try:
+            os.stat(_session_path(session_id))
+        except FileNotFoundError:
             return jsonify({"success": False, "error": "Session not found"}), 404
 
         # Update Flask session
@@ -1163,7 +1510,7 @@ def switch_conversation(session_id):
         # Load conversation
         data = request.get_json() or {}
         model = data.get('model', DEFAULT_MODEL)
-        manager = ConversationManager(session_id, model)
+        manager = ConversationManager.get(session_id, model)
 
         return jsonify({
             "success": True,
@@ -1179,12 +1526,11 @@ def switch_conversation(session_id):
 def delete_conversation(session_id):
     """Delete a conversation."""
     try:
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        # Delete the file (and any unmerged message log)
+        if not delete_session_files(session_id):
             return jsonify({"success": False, "error": "Session not found"}), 404
-
-        # Delete the file
-        os.remove(session_file)
+        index_store.remove(session_id)
+        ConversationManager.forget(session_id)
 
         # Clear current session if it's the one being deleted
         if session.get('session_id') == session_id:
@@ -1199,16 +1545,31 @@ def delete_conversation(session_id):
 def export_conversation(session_id):
     """Export conversation as JSON file."""
     try:
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        session_file = _session_path(session_id)
+        try:
+            st = os.stat(session_file)
+        except FileNotFoundError:
             return jsonify({"success": False, "error": "Session not found"}), 404
 
-        # Send file as attachment
+        # Messages still in the append-only log are merged into the download
+        if os.path.exists(_session_path(session_id, ".ndjson")):
+            data = read_session_file(Path(session_file))
+            return Response(
+                orjson.dumps(data),
+                mimetype='application/json',
+                headers={"Content-Disposition": f"attachment; filename=conversation_{session_id}.json"}
+            )
+
+        # Send file as attachment; repeat downloads of an unchanged
+        # conversation are answered with 304 from the file's stat
         return send_file(
             session_file,
             mimetype='application/json',
             as_attachment=True,
-            download_name=f"conversation_{session_id}.json"
+            download_name=f"conversation_{session_id}.json",
+            conditional=True,
+            etag=True,
+            last_modified=st.st_mtime
         )
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -1224,12 +1585,13 @@ def update_conversation_title(session_id):
         if not title:
             return jsonify({"success": False, "error": "Title cannot be empty"}), 400
 
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        try:
+            os.stat(_session_path(session_id))
+        except FileNotFoundError:
             return jsonify({"success": False, "error": "Session not found"}), 404
 
         model = data.get('model', DEFAULT_MODEL)
-        manager = ConversationManager(session_id, model)
+        manager = ConversationManager.get(session_id, model)
         manager.update_title(title)
 
         return jsonify({"success": True, "title": title})
@@ -1244,12 +1606,13 @@ def update_conversation_archive(session_id):
         data = request.get_json()
         archived = data.get('archived', False)
 
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        try:
+            os.stat(_session_path(session_id))
+        except FileNotFoundError:
             return jsonify({"success": False, "error": "Session not found"}), 404
 
         model = data.get('model', DEFAULT_MODEL)
-        manager = ConversationManager(session_id, model)
+        manager = ConversationManager.get(session_id, model)
         manager.update_archived(archived)
 
         return jsonify({"success": True, "archived": archived})
@@ -1265,49 +1628,8 @@ def search_conversations():
         if not query:
             return jsonify({"success": False, "error": "Query cannot be empty"}), 400
 
-        results = []
-        for session_file in SESSIONS_DIR.glob("*.json"):
-            try:
-                with open(session_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                    # Search in title
-                    title = data.get("title", "")
-                    if title and query in title.lower():
-                        results.append({
-                            "session_id": data.get("session_id"),
-                            "title": title,
-                            "match_type": "title",
-                            "excerpt": title
-                        })
-                        continue
-
-                    # Search in messages
-                    for msg in data.get("messages", []):
-                        content = msg.get("content", "")
-                        if query in content.lower():
-                            # Extract excerpt around match
-                            idx = content.lower().index(query)
-                            start = max(0, idx - 50)
-                            end = min(len(content), idx + len(query) + 50)
-                            excerpt = content[start:end]
-                            if start > 0:
-                                excerpt = "..." + excerpt
-                            if end < len(content):
-                                excerpt = excerpt + "..."
-
-                            results.append({
-                                "session_id": data.get("session_id"),
-                                "title": data.get("title", generate_title_from_message(
-                                    next((m["content"] for m in data.get("messages", []) if m.get("role") == "user"), "")
-                                )),
-                                "match_type": "message",
-                                "excerpt": excerpt
-                            })
-                            break  # Only include each conversation once
-            except Exception as e:
-                print(f"Error searching session {session_file}: {e}")
-                continue
+        index_store.sync()
+        results = index_store.search(query)
 
         return jsonify({"success": True, "results": results})
     except Exception as e:
@@ -1318,49 +1640,122 @@ def search_conversations():
 def share_conversation(session_id):
     """Create a shareable link for a conversation."""
     try:
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        try:
+            os.stat(_session_path(session_id))
+        except FileNotFoundError:
             return jsonify({"success": False, "error": "Session not found"}), 404
 
         # Generate share token
         token = create_share_link(session_id)
 
         # Return full URL
-        share_url = request.host_url.rstrip('/') + f'/share/{token}'
+        base_url = app.config['SHARE_BASE_URL'] or request.host_url.rstrip('/')
+        share_url = f"{base_url}/share/{token}"
 
         return jsonify({"success": True, "share_url": share_url, "token": token})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    """
+    Run several API calls in one round trip. The body is a list of
+    {"method", "path", "body"} objects; they run in order against the caller's
+    Flask session (so a later call sees an earlier one's session changes) and
+    the response lists {"status", "body"} for each. Streaming endpoints and
+    nested batches are refused.
+    """
+    try:
+        calls = request.get_json()
+        if not isinstance(calls, list):
+            return jsonify({"success": False, "error": "Expected a list of requests"}), 400
+
+        state = dict(session)
+        results = []
+        for call in calls:
+            if not isinstance(call, dict):
+                results.append({"status": 400, "body": {"success": False, "error": "Expected a request object"}})
+                continue
+            method = str(call.get('method', 'GET')).upper()
+            path = str(call.get('path', ''))
+            if not path.startswith('/api/') or path.split('?')[0] in ('/api/batch', '/api/chat/stream'):
+                results.append({"status": 400, "body": {"success": False, "error": f"Cannot batch {path}"}})
+                continue
+
+            with app.test_request_context(path, method=method, json=call.get('body'),
+                                          headers={"Cookie": request.headers.get("Cookie", "")}):
+                session.clear()
+                session.update(state)
+                response = app.full_dispatch_request()
+                state = dict(session)
+            results.append({"status": response.status_code, "body": response.get_json(silent=True)})
+
+        # Carry session changes (e.g. a new conversation) back to the caller
+        if state != dict(session):
+            session.clear()
+            session.update(state)
+        return jsonify({"success": True, "results": results})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/share/<token>')
 def view_shared_conversation(token):
     """View a shared conversation (read-only)."""
     try:
         # Get session ID from token
-        session_id = get_session_from_token(token)
-        if not session_id:
+        try:
+            session_id = _resolve_share_token(token)
+        except KeyError:
             return render_template('error.html',
                                  message="Invalid or expired share link"), 404
 
-        session_file = SESSIONS_DIR / f"{session_id}.json"
-        if not session_file.exists():
+        try:
+            signature = session_signature(SESSIONS_DIR / f"{session_id}.json")
+        except FileNotFoundError:
             return render_template('error.html',
                                  message="Conversation not found"), 404
 
-        # Load conversation data
-        with open(session_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Revisits of an unchanged conversation skip loading and rendering
+        mtime_ns, size = signature
+        etag = f"{session_id}-{mtime_ns:x}-{size:x}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
 
         # Render read-only view
-        return render_template('shared.html',
-                             conversation=data,
-                             token=token)
+        response = make_response(_render_shared_conversation(token, session_id, signature))
+        response.set_etag(etag)
+        response.last_modified = mtime_ns / 1e9
+        response.cache_control.private = True
+        response.cache_control.max_age = 60
+        return response
     except Exception as e:
         return render_template('error.html',
                              message=f"Error loading shared conversation: {str(e)}"), 500
 
 
+def warm_page_cache() -> None:
+    """Ask the kernel to prefetch the search index and session files (POSIX only)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    with os.scandir(SESSIONS_DIR) as entries:
+        paths = [entry.path for entry in entries if entry.name.endswith((".json", ".ndjson", ".db"))]
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -1385,6 +1780,9 @@ def main():
 
     args = parser.parse_args()
 
+    # First searches and share views after a restart read from a warm page cache
+    threading.Thread(target=warm_page_cache, daemon=True).start()
+
     print("=" * 60)
     print("Claude Code Chatbot Web Interface")
     print("=" * 60)
@@ -1392,7 +1790,9 @@ def main():
     print("Press Ctrl+C to stop")
     print("=" * 60)
 
-    app.run(host=args.host, port=args.port, debug=args.debug)
+    # Handlers do blocking file and subprocess I/O, so each request gets
+    # its own thread; a slow search or Claude call never queues the others
+    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
 
 
 if __name__ == '__main__':
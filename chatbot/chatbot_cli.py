@@ -4,61 +4,47 @@ Command-line chatbot interface that uses Claude Code in headless mode.
 """
 
 import argparse
-import json
-import subprocess
+import atexit
+import os
 import sys
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+import orjson
+
+from _core import (
+    CLAUDE_BIN,
+    DEFAULT_MODEL,
+    SEARCH_INDEX_FILE,
+    SESSIONS_DIR,
+    SYSTEM_PROMPT,
+    IndexStore,
+    PersistentClaude,
+    append_session_log,
+    delete_session_files,
+    generate_title_from_message,
+    read_session_file,
+    session_digest,
+    stream_claude,
+    write_session_file,
+)
 
 # Configuration
-SESSIONS_DIR = Path(__file__).parent / "sessions"
-SESSIONS_DIR.mkdir(exist_ok=True)
 CLAUDE_TIMEOUT = 60  # 1 minute timeout
-DEFAULT_MODEL = "sonnet"
+# Keep one Claude Code process per conversation instead of starting one per message
+CLAUDE_PERSIST = os.environ.get('CLAUDE_PERSIST', '').lower() in ('1', 'true', 'yes')
 
 
-def generate_title_from_message(message: str, max_length: int = 50) -> str:
-    """Generate a conversation title from the first message."""
-    if not message:
-        return "New Conversation"
-    if len(message) > max_length:
-        return message[:max_length].strip() + "..."
-    return message.strip()
+# Same manifest the web app lists from; synced against the files before each read
+index_store = IndexStore(SEARCH_INDEX_FILE)
 
 
 def list_all_sessions() -> List[Dict]:
-    """List all saved sessions."""
-    sessions = []
-    for session_file in SESSIONS_DIR.glob("*.json"):
-        try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                message_count = len(data.get("messages", []))
-                preview = ""
-                if message_count > 0:
-                    for msg in data.get("messages", []):
-                        if msg.get("role") == "user":
-                            preview = msg.get("content", "")[:100]
-                            break
-
-                sessions.append({
-                    "session_id": data.get("session_id"),
-                    "title": data.get("title", generate_title_from_message(preview)),
-                    "created_at": data.get("created_at"),
-                    "updated_at": data.get("updated_at"),
-                    "message_count": message_count,
-                    "preview": preview,
-                    "archived": data.get("archived", False),
-                    "model": data.get("model", DEFAULT_MODEL)
-                })
-        except Exception as e:
-            print(f"Error loading session {session_file}: {e}")
-            continue
-
-    sessions.sort(key=lambda x: x.get("updated_at", x.get("created_at", "")), reverse=True)
-    return sessions
+    """List all saved sessions (from the manifest, not the session files)."""
+    index_store.sync()
+    return index_store.list_sessions()
 
 
 class CLIChatbot:
@@ -69,40 +55,64 @@ class CLIChatbot:
         self.session_id = session_id or str(uuid.uuid4())
         self.session_file = SESSIONS_DIR / f"{self.session_id}.json"
         self.conversation = self._load_or_create_session()
+        self._persist = CLAUDE_PERSIST
+        self._claude: Optional[PersistentClaude] = None
+        atexit.register(self._close_claude)
 
     def _load_or_create_session(self) -> Dict:
-        """Load existing session or create new one."""
-        if self.session_file.exists():
-            with open(self.session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Add default values for new fields if missing
-                if "title" not in data:
-                    data["title"] = None
-                if "archived" not in data:
-                    data["archived"] = False
-                return data
-        else:
-            return {
-                "session_id": self.session_id,
-                "title": None,
-                "archived": False,
-                "model": self.model,
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "messages": []
-            }
-
-    def _save_session(self) -> None:
-        """Save session to disk."""
-        self.conversation["updated_at"] = datetime.now(timezone.utc).isoformat()
-        with open(self.session_file, 'w', encoding='utf-8') as f:
-            json.dump(self.conversation, f, ensure_ascii=False, indent=2)
+        """Load existing session or create new one (and note its content hash for _save_session)."""
+        data = self._load_session(self.session_file)
+        if data is None:
+            self._digest = None
+            return self._new_session()
+        self._digest = session_digest(data)
+        return data
+
+    @staticmethod
+    def _load_session(session_file: Path) -> Optional[Dict]:
+        """Read a saved session, or None if it doesn't exist."""
+        try:
+            data = read_session_file(session_file)
+        except FileNotFoundError:
+            return None
+        # Add default values for new fields if missing
+        data.setdefault("title", None)
+        data.setdefault("archived", False)
+        return data
+
+    def _new_session(self) -> Dict:
+        """A fresh, unsaved session for self.session_id."""
+        return {
+            "session_id": self.session_id,
+            "title": None,
+            "archived": False,
+            "model": self.model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "messages": []
+        }
+
+    def _save_session(self, updated_at: Optional[str] = None) -> None:
+        """Save session to disk, unless nothing changed since it was loaded or last saved."""
+        digest = session_digest(self.conversation)
+        if digest == self._digest and self.session_file.exists():
+            return
+        self.conversation["updated_at"] = updated_at or datetime.now(timezone.utc).isoformat()
+        write_session_file(self.session_id, self.session_file, self.conversation)
+        self._digest = digest
+        index_store.update(self.session_id, self.conversation, self.session_file)
+
+    def _append_messages(self, new_messages: List[Dict], updated_at: Optional[str] = None) -> None:
+        """Append a finished exchange to the session's log, or save in full when the log is due to be folded in."""
+        if not append_session_log(self.session_id, self.session_file, self.conversation, new_messages, updated_at):
+            self._save_session(updated_at)
+            return
+        self._digest = None  # The file no longer matches the last full save
+        index_store.update(self.session_id, self.conversation, self.session_file)
 
     def _build_prompt(self, user_message: str) -> str:
         """Build prompt with conversation history."""
-        prompt_parts = []
-
-        # Add system instruction
-        prompt_parts.append("You are a helpful AI assistant. Respond to the user's message naturally and conversationally.")
+        # Start with the system instruction
+        prompt_parts = [SYSTEM_PROMPT]
 
         # Add conversation history (last 10 messages for context)
         if self.conversation["messages"]:
@@ -118,57 +128,145 @@ class CLIChatbot:
 
         return "\n".join(prompt_parts)
 
-    def ask_claude(self, user_message: str) -> str:
-        """Send message to Claude Code and get response."""
-        prompt = self._build_prompt(user_message)
+    def _claude_command(self, user_message: str) -> List[str]:
+        """
+        Build the Claude Code command for this turn. Once Claude Code has
+        assigned a session ID, later turns --resume it and send only the new
+        message, since Claude already holds the history; until then (a new
+        conversation, or one that predates session IDs) the prompt carries
+        the recent history itself.
+        """
+        claude_session_id = self.conversation.get("claude_session_id")
+        if claude_session_id:
+            prompt_args = ["-p", user_message, "--resume", claude_session_id]
+        else:
+            prompt_args = ["-p", self._build_prompt(user_message)]
+        return [
+            CLAUDE_BIN,
+            *prompt_args,
+            "--output-format", "stream-json",
+            "--verbose",
+            "--include-partial-messages",
+            "--model", self.model
+        ]
 
+    def _persistent_command(self) -> List[str]:
+        """Command for a long-running Claude Code process fed messages on stdin, resuming the conversation's session if it has one."""
         cmd = [
-            "claude",
-            "-p", prompt,
-            "--output-format", "text",
+            CLAUDE_BIN,
+            "-p",
+            "--input-format", "stream-json",
+            "--output-format", "stream-json",
+            "--verbose",
+            "--include-partial-messages",
             "--model", self.model
         ]
+        claude_session_id = self.conversation.get("claude_session_id")
+        if claude_session_id:
+            cmd += ["--resume", claude_session_id]
+        return cmd
+
+    def _close_claude(self) -> None:
+        """Stop the persistent Claude Code process, if any (it belongs to one conversation)."""
+        if self._claude is not None:
+            self._claude.close()
+            self._claude = None
+
+    def _start_response(self, user_message: str) -> Iterator[str]:
+        """
+        Start streaming Claude's response: a turn on the conversation's
+        persistent process with CLAUDE_PERSIST (started, or restarted with
+        --resume, when needed), otherwise a one-shot Claude Code run.
+        """
+        if not self._persist:
+            return stream_claude(self._claude_command(user_message), CLAUDE_TIMEOUT)
+        if self._claude is None or not self._claude.alive():
+            self._claude = PersistentClaude(self._persistent_command())
+        if self.conversation.get("claude_session_id"):
+            message = user_message
+        else:
+            message = self._build_prompt(user_message)
+        return self._claude.send(message, CLAUDE_TIMEOUT)
 
+    @staticmethod
+    def _echo_response(outcome: Iterator[str], streamed: List[str]) -> Dict:
+        """Write a response's text to stdout as it streams in (collecting it in streamed); return the outcome."""
+        while True:
+            try:
+                text = next(outcome)
+            except StopIteration as done:
+                return done.value
+            streamed.append(text)
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def ask_claude(self, user_message: str) -> str:
+        """
+        Send message to Claude Code and print the response as it is generated.
+
+        Uses --output-format stream-json with partial messages, writing each
+        text delta to stdout as it arrives; the final 'result' event carries
+        the complete response that is saved. Errors are printed in its place.
+        """
+        streamed = []
         try:
-            print("\n[Claude is thinking...]")
+            outcome = self._echo_response(self._start_response(user_message), streamed)
+
+            if self._persist and outcome["result"] is None and not streamed and not outcome["timed_out"]:
+                # The persistent process died without answering (e.g. a claude
+                # without stream-json input); use one process per message
+                print("[Persistent Claude Code process unavailable, starting one per message]")
+                self._persist = False
+                outcome = self._echo_response(self._start_response(user_message), streamed)
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=CLAUDE_TIMEOUT
-            )
+            if outcome["timed_out"]:
+                return self._print_error("Error: Request timed out. Please try again.", streamed)
 
-            if result.returncode != 0:
-                error_msg = result.stderr or "Unknown error occurred"
-                return f"Error: {error_msg}"
+            # A persistent process is still running (returncode None) after a turn
+            if outcome["returncode"] not in (0, None):
+                error_msg = outcome["stderr"] or "Unknown error occurred"
+                return self._print_error(f"Error: {error_msg}", streamed)
 
-            response = result.stdout.strip()
+            result_event = outcome["result"]
+            if result_event is None:
+                return self._print_error("Error: Claude response ended without a result", streamed)
+
+            response = (result_event.get("result") or "".join(streamed)).strip()
+            if not streamed:
+                print(response, end="")
+            print()
 
             # Save messages to conversation history
-            self.conversation["messages"].append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            })
-            self.conversation["messages"].append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": datetime.now(timezone.utc).isoformat()
-            })
+            now = datetime.now(timezone.utc).isoformat()
+            new_messages = [
+                {"role": "user", "content": user_message, "timestamp": now},
+                {"role": "assistant", "content": response, "timestamp": now}
+            ]
+            self.conversation["messages"].extend(new_messages)
+
+            # Follow-up turns resume this Claude Code session
+            if result_event.get("session_id"):
+                self.conversation["claude_session_id"] = result_event["session_id"]
 
             # Auto-generate title from first message if not set
             if not self.conversation.get("title") and len(self.conversation["messages"]) == 2:
                 self.conversation["title"] = generate_title_from_message(user_message)
-
-            self._save_session()
+                self._save_session(now)
+            else:
+                self._append_messages(new_messages, now)
 
             return response
 
-        except subprocess.TimeoutExpired:
-            return "Error: Request timed out. Please try again."
         except Exception as e:
-            return f"Error: {str(e)}"
+            return self._print_error(f"Error: {str(e)}", streamed)
+
+    @staticmethod
+    def _print_error(message: str, streamed: List[str]) -> str:
+        """Print an error in place of the response (after any partial output) and return it."""
+        if streamed:
+            print()
+        print(message)
+        return message
 
     def show_history(self) -> None:
         """Display conversation history."""
@@ -191,6 +289,9 @@ class CLIChatbot:
     def clear_history(self) -> None:
         """Clear conversation history."""
         self.conversation["messages"] = []
+        # Start a fresh Claude Code session too, or it would still remember
+        self.conversation.pop("claude_session_id", None)
+        self._close_claude()
         self._save_session()
         print("\nConversation history cleared.")
 
@@ -225,13 +326,16 @@ class CLIChatbot:
         """Switch to a different conversation."""
         session_file = SESSIONS_DIR / f"{session_id}.json"
 
-        if not session_file.exists():
+        data = self._load_session(session_file)
+        if data is None:
             print(f"\nError: Session {session_id} not found.")
             return False
 
         self.session_id = session_id
         self.session_file = session_file
-        self.conversation = self._load_or_create_session()
+        self.conversation = data
+        self._digest = session_digest(data)
+        self._close_claude()
 
         title = self.conversation.get("title") or "Untitled"
         msg_count = len(self.conversation.get("messages", []))
@@ -244,7 +348,10 @@ class CLIChatbot:
         """Start a new conversation."""
         self.session_id = str(uuid.uuid4())
         self.session_file = SESSIONS_DIR / f"{self.session_id}.json"
-        self.conversation = self._load_or_create_session()
+        # A fresh UUID has no file to look for
+        self.conversation = self._new_session()
+        self._digest = None
+        self._close_claude()
         print(f"\nStarted new conversation.")
         print(f"Session ID: {self.session_id}")
 
@@ -258,7 +365,10 @@ class CLIChatbot:
 
         confirm = input(f"\nAre you sure you want to delete session {session_id[:8]}...? (yes/no): ")
         if confirm.lower() in ['yes', 'y']:
-            session_file.unlink()
+            if not delete_session_files(session_id):
+                print(f"\nError: Session {session_id} not found.")
+                return
+            index_store.remove(session_id)
             print(f"\nSession deleted.")
 
             # If deleting current session, create new one
@@ -284,45 +394,19 @@ class CLIChatbot:
 
         output_file = Path.cwd() / f"conversation_{target_id}.json"
 
-        with open(session_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = read_session_file(session_file)
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        output_file.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
         print(f"\nConversation exported to: {output_file}")
 
     def search_conversations(self, query: str) -> None:
         """Search across all conversations."""
         query = query.lower()
-        results = []
 
-        for session_file in SESSIONS_DIR.glob("*.json"):
-            try:
-                with open(session_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-
-                    # Search in title
-                    title = data.get("title", "")
-                    if title and query in title.lower():
-                        results.append({
-                            "session_id": data.get("session_id"),
-                            "title": title,
-                            "match_type": "title"
-                        })
-                        continue
-
-                    # Search in messages
-                    for msg in data.get("messages", []):
-                        if query in msg.get("content", "").lower():
-                            results.append({
-                                "session_id": data.get("session_id"),
-                                "title": title or "Untitled",
-                                "match_type": "message"
-                            })
-                            break
-            except Exception as e:
-                continue
+        # Served from the manifest's full-text index, like the web app's search
+        index_store.sync()
+        results = index_store.search(query)
 
         if not results:
             print(f"\nNo results found for: {query}")
@@ -333,7 +417,7 @@ class CLIChatbot:
         print("=" * 80)
 
         for i, result in enumerate(results, 1):
-            title = result["title"]
+            title = result["title"] or "Untitled"
             session_id = result["session_id"][:8]
             match_type = result["match_type"]
             print(f"\n[{i}] {title}")
@@ -440,14 +524,11 @@ class CLIChatbot:
                         print("Type /help to see available commands.")
                     continue
 
-                # Get response from Claude
-                response = self.ask_claude(user_input)
-
-                # Display response
+                # Get response from Claude, displayed as it streams in
                 print("\n" + "=" * 60)
                 print("Claude:")
                 print("-" * 60)
-                print(response)
+                self.ask_claude(user_input)
                 print("=" * 60)
 
             except KeyboardInterrupt:
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Serve the chatbot web interface with gevent instead of Flask's dev server.
+
+monkey.patch_all() runs before the app is imported, so the blocking calls in
+the handlers (file reads, os.remove, send_file, and above all the Claude Code
+subprocess) become cooperative and many requests overlap on one OS thread.
+
+Caveat: CPU-bound work (JSON parsing, the fallback search regex) and SQLite
+queries against search.db do not yield, so they still hold up every other
+greenlet while they run.
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse
+
+from gevent.pywsgi import WSGIServer
+
+from app import app
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description='Claude Code Chatbot Web Interface (gevent server)'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Host to bind to (default: 127.0.0.1)'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=5000,
+        help='Port to bind to (default: 5000)'
+    )
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Claude Code Chatbot Web Interface (gevent)")
+    print("=" * 60)
+    print(f"Starting server at http://{args.host}:{args.port}")
+    print("Press Ctrl+C to stop")
+    print("=" * 60)
+
+    WSGIServer((args.host, args.port), app).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
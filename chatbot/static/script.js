@@ -106,9 +106,16 @@ document.addEventListener('DOMContentLoaded', async () => {
     isDebugMode = localStorage.getItem('debugMode') === 'true';
     debugModeCheckbox.checked = isDebugMode;
 
-    loadConversations();
-    loadHistory();
-    updateContextBar();
+    // Fetch the sidebar, history and context bar in one round trip; each
+    // loader falls back to its own request if the batch fails
+    const [conversations, history, context] = await fetchBatch([
+        { method: 'GET', path: '/api/conversations' },
+        { method: 'GET', path: '/api/history' },
+        { method: 'GET', path: '/api/context' }
+    ]);
+    loadConversations(conversations);
+    loadHistory(history);
+    updateContextBar(context);
     setupEventListeners();
     userInput.focus();
 });
@@ -268,6 +275,10 @@ async function sendMessage() {
         let progressDiv = null;
         let steps = [];
 
+        // Live assistant message filled in from 'delta' events
+        let liveMessage = null;
+        let liveText = '';
+
         const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
@@ -320,6 +331,15 @@ async function sendMessage() {
                             }
                             renderProgressSteps(progressDiv, steps);
                         }
+                    } else if (data.type === 'delta') {
+                        // Render the answer as Claude generates it
+                        if (!liveMessage) {
+                            liveMessage = createLiveMessage();
+                        }
+                        liveText += data.text;
+                        liveMessage.querySelector('.message-content').innerHTML =
+                            parseMarkdown(liveText) + '<span class="typing-cursor">▌</span>';
+                        chatContainer.scrollTop = chatContainer.scrollHeight;
                     } else if (data.type === 'answer') {
                         // Keep progress visible and mark final step as complete
                         if (progressDiv && steps.length > 0) {
@@ -333,8 +353,16 @@ async function sendMessage() {
                             progressDiv.classList.add('completed');
                         }
 
+                        // The final message (with its debug panel) replaces the live one,
+                        // without replaying the typing animation for streamed text
+                        const streamed = liveMessage !== null;
+                        if (liveMessage) {
+                            liveMessage.remove();
+                            liveMessage = null;
+                        }
+
                         if (data.success) {
-                            addMessage('assistant', data.response, true, data.debug_info);
+                            addMessage('assistant', data.response, !streamed, data.debug_info);
                             await loadConversations();
                         } else {
                             addMessage('assistant', `Error: ${data.error || 'Unknown error occurred'}`);
@@ -344,6 +372,10 @@ async function sendMessage() {
                             progressDiv.remove();
                             progressDiv = null;
                         }
+                        if (liveMessage) {
+                            liveMessage.remove();
+                            liveMessage = null;
+                        }
                         addMessage('assistant', `Error: ${data.error || 'Unknown error occurred'}`);
                     }
                 } catch (e) {
@@ -425,6 +457,24 @@ function getStepIcon(status) {
     }
 }
 
+// Create an empty assistant message to stream the answer into
+function createLiveMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant';
+
+    const avatar = document.createElement('div');
+    avatar.className = 'message-avatar';
+    avatar.textContent = 'AI';
+
+    const messageContent = document.createElement('div');
+    messageContent.className = 'message-content';
+
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(messageContent);
+    chatContainer.appendChild(messageDiv);
+    return messageDiv;
+}
+
 // Add Message to UI
 function addMessage(role, content, streaming = true, debug_info = null) {
     // Add debug panel BEFORE the message for assistant messages
@@ -511,11 +561,28 @@ function setProcessing(processing) {
     }
 }
 
-// Load Conversation History
-async function loadHistory() {
+// Run several API calls in one request; returns each call's body (undefined on failure)
+async function fetchBatch(calls) {
     try {
-        const response = await fetch('/api/history');
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(calls)
+        });
         const data = await response.json();
+        if (data.success) {
+            return data.results.map(result => result.status === 200 ? result.body : undefined);
+        }
+    } catch (error) {
+        console.error('Error running batch request:', error);
+    }
+    return [];
+}
+
+// Load Conversation History
+async function loadHistory(preloaded) {
+    try {
+        const data = preloaded || await (await fetch('/api/history')).json();
 
         if (data.messages && data.messages.length > 0) {
             // Remove welcome message
@@ -566,10 +633,9 @@ async function clearChat() {
 }
 
 // Load Conversations List
-async function loadConversations() {
+async function loadConversations(preloaded) {
     try {
-        const response = await fetch('/api/conversations');
-        const data = await response.json();
+        const data = preloaded || await (await fetch('/api/conversations')).json();
 
         if (data.success) {
             allConversations = data.conversations;
@@ -1254,10 +1320,9 @@ function toggleContextBar() {
     }
 }
 
-async function updateContextBar() {
+async function updateContextBar(preloaded) {
     try {
-        const response = await fetch('/api/context');
-        const data = await response.json();
+        const data = preloaded || await (await fetch('/api/context')).json();
 
         if (data.success) {
             // Update token usage if available
@@ -0,0 +1,18 @@
+"""
+WSGI entry point for production servers such as gunicorn:
+
+    gunicorn -w 2 -k gthread --threads 8 --timeout 660 --bind 0.0.0.0:8080 wsgi:application
+
+Each thread handles one request, so up to workers x threads chats can wait on
+Claude at once. Keep --timeout above CLAUDE_TIMEOUT (600 s) so a slow answer
+is reported as a timeout by the app rather than by the server killing the worker.
+"""
+
+import threading
+
+from app import app, warm_page_cache
+
+application = app
+
+# First searches and share views after a restart read from a warm page cache
+threading.Thread(target=warm_page_cache, daemon=True).start()
@@ -14,53 +14,105 @@ conversational chatbot retrieval:
 """
 
 import argparse
-import json
+import mmap
+import os
+import re
+import shutil
 import subprocess
 import sys
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, List, Optional
 
+import orjson
+
 
 # Configuration
 DATA_DIR = Path(__file__).parent / "data"
 ESSAYS_DIR = DATA_DIR / "essays"
 INDEX_FILE = DATA_DIR / "index.json"
 LOG_FILE = Path(__file__).parent / "enrichment.log"
-REQUEST_DELAY = 2.0  # 2 seconds between requests
+REQUEST_DELAY = 2.0  # 2 seconds between request starts
+DEFAULT_WORKERS = 4  # Claude Code calls in flight at once
+SAVE_EVERY = 10  # Enriched essays buffered before index.json is rewritten
+SAVE_INTERVAL = 60.0  # ...or seconds since the last save, whichever comes first
 CLAUDE_TIMEOUT = 300  # 5 minutes per essay
+CLAUDE_BIN = shutil.which("claude") or "claude"  # Resolved on PATH once, not for every essay
+REQUIRED_FIELDS = frozenset({
+    'summary', 'topics', 'key_concepts', 'questions_answered',
+    'target_audience', 'difficulty_level'
+})  # Metadata an essay must have to count as enriched
+# A JSON object after a ``` or ```json fence, from its first { to its last };
+# the closing fence is not required, so truncated replies still parse
+JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*(\{.*\})", re.DOTALL)
+
+# Prompt body shared by every essay, after the line naming the essay file
+METADATA_INSTRUCTIONS = """Read the essay and provide the following metadata:
+
+1. **summary**: A 2-3 sentence overview of the main points
+2. **topics**: Array of 3-6 topic tags (e.g., ["startups", "fundraising", "product-market-fit"])
+3. **key_concepts**: Array of 3-5 main ideas or key terms from the essay
+4. **questions_answered**: Array of 2-4 questions this essay addresses
+5. **target_audience**: Array of 1-3 audience types (e.g., ["founders", "investors", "programmers"])
+6. **difficulty_level**: One of "beginner", "intermediate", or "advanced"
+
+Return ONLY a JSON object with these exact keys. No additional text or explanation.
+
+Example format:
+{
+  "summary": "Brief overview of the essay...",
+  "topics": ["topic1", "topic2"],
+  "key_concepts": ["concept1", "concept2"],
+  "questions_answered": ["Question 1?", "Question 2?"],
+  "target_audience": ["audience1", "audience2"],
+  "difficulty_level": "intermediate"
+}"""
 
 
 class IndexEnricher:
     """Enriches index.json with AI-generated metadata."""
 
-    def __init__(self, limit: Optional[int] = None, force: bool = False, model: str = "opus"):
+    def __init__(self, limit: Optional[int] = None, force: bool = False, model: str = "opus",
+                 workers: int = DEFAULT_WORKERS):
         self.limit = limit
         self.force = force
         self.model = model
+        self.workers = max(1, workers)
         self.index_data = {}
         self.processed_count = 0
         self.failed_count = 0
         self.skipped_count = 0
+        self._throttle_lock = threading.Lock()
+        self._log_file = None  # Held open for the duration of run()
+        self._log_lock = threading.Lock()
+        self._next_request_at = 0.0
 
     def load_index(self) -> None:
         """Load the current index.json file."""
         if not INDEX_FILE.exists():
             raise FileNotFoundError(f"Index file not found: {INDEX_FILE}")
 
-        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-            self.index_data = json.load(f)
+        # Parse straight from the page cache instead of copying the file into
+        # a bytes object first
+        with open(INDEX_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                self.index_data = orjson.loads(view)
 
         print(f"Loaded index with {self.index_data['total_count']} essays")
 
     def save_index(self) -> None:
         """Save the updated index.json file."""
-        from datetime import timezone
         self.index_data['last_updated'] = datetime.now(timezone.utc).isoformat()
 
-        with open(INDEX_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.index_data, f, ensure_ascii=False, indent=2)
+        # Same bytes json.dump(ensure_ascii=False, indent=2) wrote, several times
+        # faster; written aside and renamed so an interrupted save can't
+        # truncate the index
+        tmp_file = INDEX_FILE.with_name(INDEX_FILE.name + ".tmp")
+        tmp_file.write_bytes(orjson.dumps(self.index_data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_file, INDEX_FILE)
 
     def log(self, message: str, level: str = "INFO") -> None:
         """Write to log file and print to console."""
@@ -69,8 +121,21 @@ class IndexEnricher:
 
         print(log_message)
 
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(log_message + '\n')
+        # Workers log concurrently; the lock keeps lines whole
+        with self._log_lock:
+            if self._log_file is not None:
+                self._log_file.write(log_message + '\n')
+            else:
+                with open(LOG_FILE, 'a', encoding='utf-8') as f:
+                    f.write(log_message + '\n')
+
+    def _throttle(self) -> None:
+        """Space Claude Code calls REQUEST_DELAY apart, however many workers are running."""
+        with self._throttle_lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_request_at)
+            self._next_request_at = start_at + REQUEST_DELAY
+        time.sleep(start_at - now)
 
     def needs_enrichment(self, essay: Dict) -> bool:
         """Check if an essay needs enrichment."""
@@ -78,12 +143,7 @@ class IndexEnricher:
             return True
 
         # Check if all required metadata fields exist
-        required_fields = [
-            'summary', 'topics', 'key_concepts', 'questions_answered',
-            'target_audience', 'difficulty_level'
-        ]
-
-        return not all(field in essay for field in required_fields)
+        return not REQUIRED_FIELDS.issubset(essay.keys())
 
     def extract_metadata(self, essay: Dict) -> Optional[Dict]:
         """Use Claude Code to extract metadata from an essay."""
@@ -93,55 +153,36 @@ class IndexEnricher:
             self.log(f"Essay file not found: {essay_path}", "ERROR")
             return None
 
-        # Construct the prompt
-        prompt = f"""Analyze the essay at {essay_path} and extract metadata in JSON format.
-
-Read the essay and provide the following metadata:
-
-1. **summary**: A 2-3 sentence overview of the main points
-2. **topics**: Array of 3-6 topic tags (e.g., ["startups", "fundraising", "product-market-fit"])
-3. **key_concepts**: Array of 3-5 main ideas or key terms from the essay
-4. **questions_answered**: Array of 2-4 questions this essay addresses
-5. **target_audience**: Array of 1-3 audience types (e.g., ["founders", "investors", "programmers"])
-6. **difficulty_level**: One of "beginner", "intermediate", or "advanced"
-
-Return ONLY a JSON object with these exact keys. No additional text or explanation.
-
-Example format:
-{{
-  "summary": "Brief overview of the essay...",
-  "topics": ["topic1", "topic2"],
-  "key_concepts": ["concept1", "concept2"],
-  "questions_answered": ["Question 1?", "Question 2?"],
-  "target_audience": ["audience1", "audience2"],
-  "difficulty_level": "intermediate"
-}}"""
+        # Only the path varies between essays
+        prompt = f"Analyze the essay at {essay_path} and extract metadata in JSON format.\n\n{METADATA_INSTRUCTIONS}"
 
         try:
             # Call Claude Code in headless mode
             cmd = [
-                "claude",
+                CLAUDE_BIN,
                 "-p", prompt,
                 "--output-format", "json",
                 "--model", self.model
             ]
 
+            self._throttle()
             self.log(f"Processing: {essay['title']} ({essay['id']})")
 
+            # Captured as bytes: orjson parses them directly, and only the
+            # text that gets logged is decoded
             result = subprocess.run(
                 cmd,
                 capture_output=True,
-                text=True,
                 timeout=CLAUDE_TIMEOUT
             )
 
             if result.returncode != 0:
-                self.log(f"Claude Code failed: {result.stderr}", "ERROR")
+                self.log(f"Claude Code failed: {result.stderr.decode('utf-8', 'replace')}", "ERROR")
                 return None
 
             # Parse the JSON output
             try:
-                response = json.loads(result.stdout)
+                response = orjson.loads(result.stdout)
 
                 # Extract the result field from Claude's JSON response
                 if 'result' in response:
@@ -149,18 +190,15 @@ Example format:
                     # We need to parse it again
                     metadata_str = response['result']
 
-                    # Try to find JSON in the result string
-                    # Claude might return it wrapped in markdown code blocks
-                    if '```json' in metadata_str:
-                        # Extract JSON from markdown code block
-                        start = metadata_str.find('{')
-                        end = metadata_str.rfind('}') + 1
-                        metadata_str = metadata_str[start:end]
-                    elif '```' in metadata_str:
-                        # Remove markdown code blocks
-                        metadata_str = metadata_str.replace('```', '').strip()
+                    # Claude might return it wrapped in a markdown code block
+                    block = JSON_BLOCK_PATTERN.search(metadata_str)
+                    if block:
+                        metadata_str = block.group(1)
 
-                    metadata = json.loads(metadata_str)
+                    metadata = orjson.loads(metadata_str)
+                    if not isinstance(metadata, dict):
+                        self.log(f"Expected a JSON object, got: {metadata_str[:200]}", "ERROR")
+                        return None
 
                     # Log cost if available
                     if 'total_cost_usd' in response:
@@ -171,9 +209,9 @@ Example format:
                     self.log(f"Unexpected response format: {response}", "ERROR")
                     return None
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 self.log(f"Failed to parse JSON response: {e}", "ERROR")
-                self.log(f"Response: {result.stdout[:500]}", "ERROR")
+                self.log(f"Response: {result.stdout[:500].decode('utf-8', 'replace')}", "ERROR")
                 return None
 
         except subprocess.TimeoutExpired:
@@ -183,15 +221,8 @@ Example format:
             self.log(f"Error processing essay: {e}", "ERROR")
             return None
 
-    def enrich_essay(self, essay: Dict) -> bool:
-        """Enrich a single essay with metadata."""
-        if not self.needs_enrichment(essay):
-            self.log(f"Skipping (already enriched): {essay['title']}")
-            self.skipped_count += 1
-            return True
-
-        metadata = self.extract_metadata(essay)
-
+    def enrich_essay(self, essay: Dict, metadata: Optional[Dict]) -> bool:
+        """Merge metadata extracted for an essay into it (None means extraction failed)."""
         if metadata is None:
             self.failed_count += 1
             return False
@@ -200,7 +231,6 @@ Example format:
         essay.update(metadata)
 
         # Mark as enriched
-        from datetime import timezone
         essay['enriched_at'] = datetime.now(timezone.utc).isoformat()
 
         self.processed_count += 1
@@ -216,49 +246,80 @@ Example format:
         print(f"Model: {self.model}")
         print(f"Limit: {self.limit if self.limit else 'None (all essays)'}")
         print(f"Force re-enrich: {self.force}")
+        print(f"Workers: {self.workers}")
         print("=" * 60)
 
-        # Initialize log
-        with open(LOG_FILE, 'w', encoding='utf-8') as f:
-            f.write(f"Enrichment started at {datetime.now()}\n")
-            f.write("=" * 60 + "\n")
-
-        # Load index
-        self.load_index()
-
-        # Get essays to process
-        essays = self.index_data['essays']
-
-        if self.limit:
-            essays = essays[:self.limit]
-            self.log(f"Processing first {self.limit} essays")
-        else:
-            self.log(f"Processing all {len(essays)} essays")
-
-        # Process each essay
-        for i, essay in enumerate(essays, 1):
-            print(f"\n[{i}/{len(essays)}]", end=" ")
-
-            # Enrich the essay
-            success = self.enrich_essay(essay)
-
-            # Save progress incrementally
-            if success:
-                self.save_index()
-
-            # Rate limiting (except for last essay)
-            if i < len(essays):
-                time.sleep(REQUEST_DELAY)
-
-        # Final summary
-        print("\n" + "=" * 60)
-        print("Enrichment Complete!")
-        print(f"Successfully enriched: {self.processed_count}")
-        print(f"Already enriched (skipped): {self.skipped_count}")
-        print(f"Failed: {self.failed_count}")
-        print(f"Index saved to: {INDEX_FILE}")
-        print(f"Log saved to: {LOG_FILE}")
-        print("=" * 60)
+        # Initialize log; one line-buffered handle instead of an open() per
+        # line, so the file can still be followed with tail -f
+        self._log_file = open(LOG_FILE, 'w', encoding='utf-8', buffering=1)
+        self._log_file.write(f"Enrichment started at {datetime.now()}\n")
+        self._log_file.write("=" * 60 + "\n")
+
+        try:
+            # Load index
+            self.load_index()
+
+            # Get essays to process
+            essays = self.index_data['essays']
+
+            if self.limit:
+                essays = essays[:self.limit]
+                self.log(f"Processing first {self.limit} essays")
+            else:
+                self.log(f"Processing all {len(essays)} essays")
+
+            pending = []
+            for essay in essays:
+                if self.needs_enrichment(essay):
+                    pending.append(essay)
+                else:
+                    self.log(f"Skipping (already enriched): {essay['title']}")
+                    self.skipped_count += 1
+
+            # Claude calls run on worker threads; results are merged and saved
+            # here, so the index is only ever touched by this thread
+            pool = ThreadPoolExecutor(max_workers=self.workers)
+            unsaved = 0
+            last_save = time.monotonic()
+            try:
+                futures = {pool.submit(self.extract_metadata, essay): essay for essay in pending}
+                for i, future in enumerate(as_completed(futures), 1):
+                    print(f"\n[{i}/{len(pending)}]", end=" ")
+
+                    # Save progress every few essays rather than rewriting the
+                    # whole index after each one
+                    if self.enrich_essay(futures[future], future.result()):
+                        unsaved += 1
+                    if unsaved >= SAVE_EVERY or (unsaved and time.monotonic() - last_save >= SAVE_INTERVAL):
+                        self.save_index()
+                        unsaved = 0
+                        last_save = time.monotonic()
+            except BaseException:
+                # Drop queued essays on Ctrl-C or any error, rather than have
+                # the pool make (and pay for) every remaining Claude call
+                # before the process can exit; calls in flight on Ctrl-C got
+                # the same SIGINT
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            finally:
+                # Keep whatever was enriched, even on Ctrl-C or an error
+                if unsaved:
+                    self.save_index()
+            pool.shutdown()
+
+            # Final summary
+            print("\n" + "=" * 60)
+            print("Enrichment Complete!")
+            print(f"Successfully enriched: {self.processed_count}")
+            print(f"Already enriched (skipped): {self.skipped_count}")
+            print(f"Failed: {self.failed_count}")
+            print(f"Index saved to: {INDEX_FILE}")
+            print(f"Log saved to: {LOG_FILE}")
+            print("=" * 60)
+        finally:
+            with self._log_lock:
+                self._log_file.close()
+                self._log_file = None
 
 
 def main():
@@ -282,6 +343,12 @@ def main():
         default='opus',
         help='Claude model to use (default: opus)'
     )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Essays to enrich concurrently (default: {DEFAULT_WORKERS})'
+    )
 
     args = parser.parse_args()
 
@@ -289,7 +356,8 @@ def main():
         enricher = IndexEnricher(
             limit=args.limit,
             force=args.force,
-            model=args.model
+            model=args.model,
+            workers=args.workers
         )
         enricher.run()
     except KeyboardInterrupt: